@@ -1,34 +1,50 @@
 import os
-from flask import Flask, request, jsonify, make_response
+from config import Config, MEDIA_GROUP_MAX, clamp_batch_size
+from logging_setup import setup_logging
+
+# Before the imports below, which log while connecting to storage
+setup_logging()
+
+from flask import Flask, request, jsonify, make_response, Response, stream_with_context
 from flask_cors import CORS
-from db_operations import DatabaseOperations
+from db_operations import DatabaseOperations, db
 from datetime import datetime, timedelta
-from cosmos_db import cosmos_db
-import asyncio
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.events import EVENT_JOB_MISSED
 import praw
 from telegram.ext import Application
+from telegram import InputMediaPhoto, InputMediaVideo
+from telegram.error import BadRequest, RetryAfter
 import logging
-from logging.handlers import RotatingFileHandler
 import re
-import requests
 from urllib.parse import urlparse
 import hashlib
-from config import Config
+import time
+import tempfile
+from contextlib import contextmanager, ExitStack
+from telegram_sender import TelegramSender, SendOutcomeUnknown
+from pipeline import Pipeline, Tick, MediaItem
+from media_cache import media_cache
+from file_id_cache import telegram_file_ids
+from http_client import http_client
+from redgifs import redgifs
+from listing_cache import ListingCache, LISTING_TTLS
+from ttl_cache import TTLCache
+from listing_batcher import ListingBatcher
+from candidate_queue import CandidateQueues
+from prefetcher import MediaPrefetcher
+from async_downloader import AsyncDownloader, BudgetExceeded, async_downloader
+from rate_limit import reddit_limiter, telegram_limiters, rate_limit_stats
+from perceptual_hash import dhash, media_hash_index
+import metrics
+from cosmos_stats import cosmos_request_stats
+import html
+import io
+import json
+import base64
 import traceback
 
-# Set up logging with rotation
-log_handler = RotatingFileHandler(
-    'app.log',
-    maxBytes=1024 * 1024,  # 1MB
-    backupCount=3  # Keep 3 backup files
-)
-log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logging.basicConfig(
-    level=logging.DEBUG,
-    handlers=[log_handler]
-)
-
 def create_app():
     # Print configuration for debugging
     Config.print_config()
@@ -50,38 +66,24 @@ app = create_app()
 reddit = praw.Reddit(
     client_id=Config.REDDIT_CLIENT_ID,
     client_secret=Config.REDDIT_CLIENT_SECRET,
-    user_agent='RedditTelegramBot/1.0'
+    user_agent='RedditTelegramBot/1.0',
+    reddit_url=Config.REDDIT_URL,
+    oauth_url=Config.REDDIT_OAUTH_URL
 )
 reddit.read_only = True
 
 # Initialize Telegram bot
-telegram_app = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
+telegram_app = (
+    Application.builder()
+    .token(Config.TELEGRAM_BOT_TOKEN)
+    .base_url(Config.TELEGRAM_API_URL)
+    .connection_pool_size(Config.TELEGRAM_POOL_SIZE)
+    .build()
+)
+# One persistent loop and Bot client shared by all scheduler jobs
+telegram_sender = TelegramSender(telegram_app)
 TELEGRAM_CHANNEL_ID = Config.TELEGRAM_CHANNEL_ID
 
-# Redgifs API configuration
-REDGIFS_TOKEN = None
-REDGIFS_TOKEN_EXPIRES = 0
-
-def get_redgifs_token():
-    """Get a new access token for Redgifs API"""
-    global REDGIFS_TOKEN, REDGIFS_TOKEN_EXPIRES
-    
-    current_time = datetime.now().timestamp()
-    if REDGIFS_TOKEN and current_time < REDGIFS_TOKEN_EXPIRES:
-        return REDGIFS_TOKEN
-        
-    try:
-        response = requests.get('https://api.redgifs.com/v2/auth/temporary')
-        if response.status_code == 200:
-            data = response.json()
-            REDGIFS_TOKEN = data.get('token')
-            # Token expires in 1 hour, we'll refresh 5 minutes early
-            REDGIFS_TOKEN_EXPIRES = current_time + 3300  # 55 minutes
-            return REDGIFS_TOKEN
-    except Exception as e:
-        logging.error(f"Error getting Redgifs token: {str(e)}")
-    return None
-
 def is_image_url(url):
     """Check if URL is an image."""
     if url.endswith(('.jpg', '.jpeg', '.png', '.gif')):
@@ -114,185 +116,823 @@ def get_video_url(post):
                 video_id = post.url.split('/watch/')[-1]
             else:
                 video_id = post.url.split('/')[-1]
-            
-            token = get_redgifs_token()
-            if not token:
-                logging.error("Failed to get Redgifs token")
-                return None
-                
-            headers = {'Authorization': f'Bearer {token}'}
-            api_url = f'https://api.redgifs.com/v2/gifs/{video_id}'
-            
-            response = requests.get(api_url, headers=headers)
-            if response.status_code == 200:
-                data = response.json()
-                urls = data.get('gif', {}).get('urls', {})
-                return urls.get('hd') or urls.get('sd')
-            else:
-                logging.error(f"Failed to get Redgifs video URL: {response.status_code}")
-                return None
+            return redgifs.get_video_url(video_id.lower())
         return post.url
     except Exception as e:
         logging.error(f"Error getting video URL: {str(e)}")
         return None
 
-def download_media(url, post_id, is_video=False):
-    """Download media file and return local path"""
+def is_gallery_url(url):
+    """Check if URL is a Reddit gallery."""
+    return '/gallery/' in url
+
+def gallery_media(post):
+    """(url, is_video) of each item of a Reddit gallery post, in gallery order"""
     try:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        file_hash = hashlib.md5(url.encode()).hexdigest()[:8]
-        
-        parsed_url = urlparse(url)
-        ext = os.path.splitext(parsed_url.path)[1]
-        if not ext:
-            ext = '.mp4' if is_video else '.jpg'
-        
-        filename = f"{post_id}_{timestamp}_{file_hash}{ext}"
-        base_dir = 'downloads/videos' if is_video else 'downloads/pics'
-        filepath = os.path.join(base_dir, filename)
-        
-        response = requests.get(url, stream=True)
+        metadata = post.media_metadata or {}
+        items = (post.gallery_data or {}).get('items', [])
+    except AttributeError:
+        return []
+    media = []
+    for item in items:
+        meta = metadata.get(item.get('media_id'), {})
+        if meta.get('status') != 'valid':
+            continue
+        source = meta.get('s', {})
+        if source.get('mp4'):
+            media.append((html.unescape(source['mp4']), True))
+        elif source.get('u') or source.get('gif'):
+            media.append((html.unescape(source.get('u') or source['gif']), False))
+    return media
+
+def media_extension(url, is_video=False):
+    ext = os.path.splitext(urlparse(url).path)[1]
+    if not ext:
+        ext = '.mp4' if is_video else '.jpg'
+    return ext
+
+def download_media(url, post_id, is_video=False, budget=None, pin=False):
+    """Download media file (or reuse the cached copy) and return local path.
+
+    With a ByteBudget, the download is skipped if its Content-Length (or the
+    budget's allowance for unknown sizes) does not fit.
+    With pin, the file stays in the cache until media_cache.release(path).
+    """
+    reserved = 0
+    response = None
+    try:
+        cached_path = media_cache.get(url, pin=pin)
+        if cached_path:
+            logging.info(f"Using cached media for post {post_id}: {cached_path}")
+            return cached_path
+
+        ext = media_extension(url, is_video)
+        if Config.DOWNLOAD_BACKEND == 'async':
+            part_path = AsyncDownloader.part_path(media_cache.parts_dir, url)
+            try:
+                filepath = async_downloader.download(
+                    url, part_path, budget=budget,
+                    finish=lambda path: media_cache.put_file(url, path, ext)
+                )
+            except BudgetExceeded:
+                logging.info(f"Byte budget full, not downloading media for post {post_id}")
+                return None
+            # Pinned per caller: concurrent downloads of one URL share a single finish call
+            if pin and not media_cache.pin(filepath):
+                logging.warning(f"Media for post {post_id} was evicted right after downloading")
+                return None
+            logging.info(f"Successfully downloaded media to {filepath}")
+            return filepath
+
+        response = http_client.get(url, stream=True)
         response.raise_for_status()
-        
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        
+
+        if budget is not None:
+            reserved = budget.try_reserve(int(response.headers.get('Content-Length') or 0))
+            if not reserved:
+                logging.info(f"Byte budget full, not downloading media for post {post_id}")
+                return None
+
+        filepath = media_cache.put_stream(url, response.iter_content(chunk_size=8192), ext, pin=pin)
         logging.info(f"Successfully downloaded media to {filepath}")
         return filepath
     except Exception as e:
         logging.error(f"Error downloading media: {str(e)}")
         return None
+    finally:
+        # Returns the pooled connection even when put_stream fails midway
+        if response is not None:
+            response.close()
+        if reserved:
+            budget.release(reserved)
+
+class MediaTooLarge(Exception):
+    """Media over MEDIA_RELAY_MAX_BYTES, to be downloaded to disk instead of relayed"""
+
+def relay_media(url, post_id, is_video=False):
+    """Stream media into a spooled buffer without the local file round-trip.
 
-async def send_telegram_photo(chat_id, photo_path, caption):
-    """Helper function to send photo to telegram"""
-    logging.info(f"Attempting to send photo to Telegram - Path: {photo_path}")
+    The buffer stays in memory up to MEDIA_SPOOL_MAX_BYTES and spills to a
+    temp file beyond that. Returns (buffer, content hash, filename) or
+    (None, None, None) on failure; raises MediaTooLarge past
+    MEDIA_RELAY_MAX_BYTES, since the upload holds the whole file in memory.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=Config.MEDIA_SPOOL_MAX_BYTES)
+    response = None
     try:
-        async with telegram_app:
-            with open(photo_path, 'rb') as photo:
-                await telegram_app.bot.send_photo(
+        response = http_client.get(url, stream=True)
+        response.raise_for_status()
+        if int(response.headers.get('Content-Length') or 0) > Config.MEDIA_RELAY_MAX_BYTES:
+            raise MediaTooLarge(url)
+
+        digest = hashlib.sha256()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            if chunk:
+                digest.update(chunk)
+                buffer.write(chunk)
+                if buffer.tell() > Config.MEDIA_RELAY_MAX_BYTES:
+                    raise MediaTooLarge(url)
+        size = buffer.tell()
+        buffer.seek(0)
+
+        content_hash = digest.hexdigest()
+        filename = f"{post_id}{media_extension(url, is_video)}"
+        logging.info(f"Relayed {size} bytes of media for post {post_id}")
+        return buffer, content_hash, filename
+    except MediaTooLarge:
+        buffer.close()
+        raise
+    except Exception as e:
+        buffer.close()
+        logging.error(f"Error relaying media: {str(e)}")
+        return None, None, None
+    finally:
+        if response is not None:
+            response.close()
+
+@contextmanager
+def open_media(source):
+    """Open a media path, or read back an already-open media buffer"""
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            yield f
+    else:
+        # python-telegram-bot takes no file object without a usable .name, and it
+        # reads every upload into memory before sending; relay_media caps the size
+        source.seek(0)
+        yield source.read()
+
+async def send_telegram_photo(chat_id, photo_source, caption, file_id=None, filename=None):
+    """Helper function to send photo (path or open buffer) to telegram, returns the photo's file_id"""
+    logging.info(f"Attempting to send photo to Telegram - Source: {photo_source}")
+    try:
+        message = None
+        if file_id:
+            try:
+                message = await telegram_app.bot.send_photo(
                     chat_id=chat_id,
-                    photo=photo,
+                    photo=file_id,
                     caption=caption
                 )
+            except BadRequest as e:
+                logging.warning(f"Telegram rejected cached file_id, uploading instead: {str(e)}")
+        if message is None:
+            with open_media(photo_source) as photo:
+                message = await telegram_app.bot.send_photo(
+                    chat_id=chat_id,
+                    photo=photo,
+                    caption=caption,
+                    filename=filename
+                )
         logging.info("Successfully sent photo to Telegram")
+        return message.photo[-1].file_id if message.photo else None
     except Exception as e:
         logging.error(f"Failed to send photo to Telegram: {str(e)}")
         raise
 
-async def send_telegram_video(chat_id, video_path, caption):
-    """Helper function to send video to telegram"""
-    logging.info(f"Attempting to send video to Telegram - Path: {video_path}")
+async def send_telegram_video(chat_id, video_source, caption, file_id=None, filename=None):
+    """Helper function to send video (path or open buffer) to telegram, returns the video's file_id"""
+    logging.info(f"Attempting to send video to Telegram - Source: {video_source}")
     try:
-        async with telegram_app:
-            with open(video_path, 'rb') as video:
-                await telegram_app.bot.send_video(
+        message = None
+        if file_id:
+            try:
+                message = await telegram_app.bot.send_video(
                     chat_id=chat_id,
-                    video=video,
+                    video=file_id,
                     caption=caption
                 )
+            except BadRequest as e:
+                logging.warning(f"Telegram rejected cached file_id, uploading instead: {str(e)}")
+        if message is None:
+            with open_media(video_source) as video:
+                message = await telegram_app.bot.send_video(
+                    chat_id=chat_id,
+                    video=video,
+                    caption=caption,
+                    filename=filename
+                )
         logging.info("Successfully sent video to Telegram")
+        return message.video.file_id if message.video else None
     except Exception as e:
         logging.error(f"Failed to send video to Telegram: {str(e)}")
         raise
 
-def send_to_telegram(subreddit_config):
+def input_media(items, file_ids, stack):
+    """InputMedia for each item, using its known file_id or its opened file"""
+    media = []
+    for item, file_id in zip(items, file_ids):
+        source = file_id or stack.enter_context(open_media(item.source))
+        media_class = InputMediaVideo if item.is_video else InputMediaPhoto
+        media.append(media_class(
+            media=source,
+            caption=item.caption,
+            filename=None if file_id else item.media_filename
+        ))
+    return media
+
+def message_file_id(message):
+    if message.photo:
+        return message.photo[-1].file_id
+    if message.video:
+        return message.video.file_id
+    return None
+
+async def send_telegram_media_group(chat_id, items, file_ids=None):
+    """Helper function to send several media items as one album, returns each item's file_id"""
+    logging.info(f"Attempting to send album of {len(items)} items to Telegram")
     try:
-        logging.info(f"Processing subreddit: {subreddit_config['subreddit_name']}")
-        subreddit = reddit.subreddit(subreddit_config['subreddit_name'])
-        
-        if subreddit_config['filter_type'] == 'top_day':
-            logging.info("Fetching top posts of the day")
-            posts = list(subreddit.top(time_filter='day', limit=50))
-        elif subreddit_config['filter_type'] == 'top_week':
-            logging.info("Fetching top posts of the week")
-            posts = list(subreddit.top(time_filter='week', limit=50))
-        elif subreddit_config['filter_type'] == 'top_month':
-            logging.info("Fetching top posts of the month")
-            posts = list(subreddit.top(time_filter='month', limit=50))
+        messages = None
+        if file_ids and any(file_ids):
+            try:
+                with ExitStack() as stack:
+                    messages = await telegram_app.bot.send_media_group(
+                        chat_id=chat_id,
+                        media=input_media(items, file_ids, stack)
+                    )
+            except BadRequest as e:
+                logging.warning(f"Telegram rejected a cached file_id, uploading album instead: {str(e)}")
+        if messages is None:
+            with ExitStack() as stack:
+                messages = await telegram_app.bot.send_media_group(
+                    chat_id=chat_id,
+                    media=input_media(items, [None] * len(items), stack)
+                )
+        logging.info("Successfully sent album to Telegram")
+        return [message_file_id(message) for message in messages]
+    except Exception as e:
+        logging.error(f"Failed to send album to Telegram: {str(e)}")
+        raise
+
+TELEGRAM_FLOOD_RETRIES = 2
+
+TIME_FILTERS = {
+    'top_day': 'day',
+    'top_week': 'week',
+    'top_month': 'month',
+    'top_year': 'year'
+}
+
+def fetch_listing(subreddit_name, filter_type):
+    """Fetch a subreddit's top listing from Reddit"""
+    subreddit = reddit.subreddit(subreddit_name)
+    time_filter = TIME_FILTERS.get(filter_type, 'year')
+    logging.info(f"Fetching top posts of the {time_filter} for r/{subreddit_name}")
+    reddit_limiter.acquire()
+    try:
+        with metrics.reddit_fetch_seconds.time(subreddit=subreddit_name):
+            return list(subreddit.top(time_filter=time_filter, limit=50))
+    except Exception:
+        metrics.reddit_fetch_errors_total.inc(subreddit=subreddit_name)
+        raise
+
+# Multireddit fetches span many subreddits; one label keeps metric cardinality bounded
+COMBINED_LISTING_LABEL = '(combined)'
+
+def fetch_combined_listing(subreddit_names, filter_type):
+    """Fetch one multireddit listing and split it by subreddit"""
+    multireddit = reddit.subreddit('+'.join(subreddit_names))
+    time_filter = TIME_FILTERS.get(filter_type, 'year')
+    limit = min(Config.REDDIT_BATCH_POSTS_PER_SUBREDDIT * len(subreddit_names), 1000)
+    listings = {name: [] for name in subreddit_names}
+    # PRAW pages listings 100 posts per request
+    reddit_limiter.acquire(-(-limit // 100))
+    try:
+        with metrics.reddit_fetch_seconds.time(subreddit=COMBINED_LISTING_LABEL):
+            for post in multireddit.top(time_filter=time_filter, limit=limit):
+                listings.setdefault(post.subreddit.display_name.lower(), []).append(post)
+    except Exception:
+        metrics.reddit_fetch_errors_total.inc(subreddit=COMBINED_LISTING_LABEL)
+        raise
+    return listings
+
+def due_soon_subreddits(filter_type):
+    """Subreddits of scheduled configs with this filter that are due shortly and not cached"""
+    horizon = datetime.now().astimezone() + timedelta(seconds=Config.REDDIT_BATCH_LOOKAHEAD_SECONDS)
+    names = []
+    for job in scheduler.get_jobs():
+        if not job.id.startswith('subreddit_') or not job.args or not job.next_run_time:
+            continue
+        config = job.args[0]
+        if config['filter_type'] != filter_type or job.next_run_time > horizon:
+            continue
+        if not listing_cache.is_cached(config['subreddit_name'], filter_type):
+            names.append(config['subreddit_name'])
+    return names
+
+# Ticks fetch a missing listing directly; batch mode fills the cache ahead of them
+listing_cache = ListingCache(fetch_listing, LISTING_TTLS)
+listing_batcher = ListingBatcher(
+    fetch_combined=fetch_combined_listing,
+    fetch_single=fetch_listing,
+    filter_types=LISTING_TTLS,
+    due_soon=due_soon_subreddits,
+    on_listing=listing_cache.put,
+    max_subreddits=Config.REDDIT_BATCH_MAX_SUBREDDITS,
+    min_posts=Config.REDDIT_BATCH_MIN_POSTS,
+    workers=Config.REDDIT_BATCH_FALLBACK_WORKERS
+)
+
+def config_batch_size(config):
+    """How many media items a tick of this config may send as one album"""
+    return clamp_batch_size(config.get('batch_size'))
+
+def is_sendable(post):
+    """Cheap URL-only check for image or video posts"""
+    return hasattr(post, 'url') and (
+        is_image_url(post.url) or is_video_url(post.url, post) or is_gallery_url(post.url)
+    )
+
+def build_candidates(config):
+    """Fetch, rank, dedup and classify a config's listing into sendable candidates"""
+    posts = listing_cache.get(config['subreddit_name'], config['filter_type'])
+    posts.sort(key=lambda x: x.score, reverse=True)
+    sent_post_ids = DatabaseOperations.find_sent_post_ids(
+        [post.id for post in posts],
+        config['subreddit_name']
+    )
+    return [post for post in posts if post.id not in sent_post_ids and is_sendable(post)]
+
+candidate_queues = CandidateQueues(
+    fill=build_candidates,
+    depth=Config.CANDIDATE_QUEUE_DEPTH,
+    low_water=Config.CANDIDATE_QUEUE_LOW_WATER,
+    max_age=Config.CANDIDATE_QUEUE_MAX_AGE_SECONDS,
+    workers=Config.CANDIDATE_REFILL_WORKERS
+)
+
+def fetch_stage(tick):
+    """Take the config's precomputed candidates, best posts first"""
+    logging.info(f"Processing subreddit: {tick.subreddit_name}")
+    tick.posts = candidate_queues.take(tick.config)
+    return 'dedup'
+
+def dedup_stage(tick):
+    """Drop posts that were already sent since the candidates were queued"""
+    # Check all candidates for duplicates at once instead of one query per post
+    sent_post_ids = DatabaseOperations.find_sent_post_ids(
+        [post.id for post in tick.posts],
+        tick.subreddit_name
+    )
+    tick.candidates = []
+    for post in tick.posts:
+        if post.id in sent_post_ids:
+            logging.info(f"Post {post.id} is a duplicate, skipping")
+            metrics.skipped_posts_total.inc(subreddit=tick.subreddit_name, reason='sent')
+            candidate_queues.discard(tick.key, post.id)
+            continue
+        tick.candidates.append(post)
+    return 'resolve'
+
+def resolve_stage(tick):
+    """Pick the next candidate with sendable media and resolve its media URL"""
+    tick.post = None
+    tick.gallery = False
+    tick.pending_media = []
+    while tick.candidates:
+        post = tick.candidates.pop(0)
+        if not hasattr(post, 'url'):
+            continue
+        logging.info(f"Checking post: {post.id} - Score: {post.score} - URL: {post.url}")
+
+        if is_gallery_url(post.url):
+            media = gallery_media(post)[:MEDIA_GROUP_MAX - len(tick.batch)]
+            if media:
+                logging.info(f"Found gallery post: {post.id} with {len(media)} items")
+                tick.post, tick.gallery = post, True
+                (tick.media_url, tick.is_video), tick.pending_media = media[0], media[1:]
+                return 'download'
+            logging.error(f"Could not get gallery media for post {post.id}")
+        elif is_image_url(post.url):
+            logging.info(f"Found image post: {post.id} with URL: {post.url}")
+            tick.post, tick.is_video, tick.media_url = post, False, post.url
+            return 'download'
+        elif is_video_url(post.url, post):
+            logging.info(f"Found video post: {post.id}")
+            video_url = get_video_url(post)
+            if video_url:
+                tick.post, tick.is_video, tick.media_url = post, True, video_url
+                return 'download'
+            logging.error(f"Could not get video URL for post {post.id}")
         else:
-            logging.info("Fetching top posts of the year")
-            posts = list(subreddit.top(time_filter='year', limit=50))
+            logging.info(f"Post {post.id} is not an image or video post, skipping")
+        candidate_queues.discard(tick.key, post.id)
+    return 'upload' if tick.batch else 'record'
 
-        posts.sort(key=lambda x: x.score, reverse=True)
-        
-        content_found = False
-        for post in posts:
-            logging.info(f"Checking post: {post.id} - Score: {post.score} - URL: {post.url}")
-            if DatabaseOperations.is_duplicate_post(post.id):
-                logging.info(f"Post {post.id} is a duplicate, skipping")
-                continue
+# Preview hashes of queued candidates, computed ahead of their tick by the prefetcher
+preview_hashes = TTLCache(24 * 3600, maxsize=4096)
+
+def preview_phash(post):
+    """Perceptual hash of a post's Reddit preview image (a still frame for videos)"""
+    # Only what the listing carried: post.preview on a post without one makes PRAW fetch the whole submission
+    try:
+        preview_url = html.unescape(vars(post)['preview']['images'][0]['source']['url'])
+    except (KeyError, IndexError, TypeError):
+        return None
+    try:
+        response = http_client.get(preview_url)
+        response.raise_for_status()
+    except Exception as e:
+        logging.warning(f"Could not fetch preview for post {post.id}: {str(e)}")
+        return None
+    return dhash(io.BytesIO(response.content))
 
-            if hasattr(post, 'url'):
-                if is_image_url(post.url):
-                    logging.info(f"Found image post: {post.id} with URL: {post.url}")
-                    local_path = download_media(post.url, post.id, is_video=False)
-                    if local_path:
-                        try:
-                            asyncio.run(send_telegram_photo(
-                                chat_id=TELEGRAM_CHANNEL_ID,
-                                photo_path=local_path,
-                                caption=f"From r/{subreddit_config['subreddit_name']}: {post.title}\nUpvotes: {post.score:,}"
-                            ))
-                            content_found = True
-                        except Exception as e:
-                            logging.error(f"Error sending image post {post.id}: {str(e)}")
-                            continue
-                elif is_video_url(post.url, post):
-                    logging.info(f"Found video post: {post.id}")
-                    video_url = get_video_url(post)
-                    if video_url:
-                        local_path = download_media(video_url, post.id, is_video=True)
-                        if local_path:
-                            try:
-                                asyncio.run(send_telegram_video(
-                                    chat_id=TELEGRAM_CHANNEL_ID,
-                                    video_path=local_path,
-                                    caption=f"From r/{subreddit_config['subreddit_name']}: {post.title}\nUpvotes: {post.score:,}"
-                                ))
-                                content_found = True
-                            except Exception as e:
-                                logging.error(f"Error sending video post {post.id}: {str(e)}")
-                                continue
-                    else:
-                        logging.error(f"Could not get video URL for post {post.id}")
-                        continue
+def skip_repost(tick):
+    """Drop the tick's post if its media was already sent, recording it as a repost.
+
+    Otherwise its hash is reserved until the tick finishes, so a cross-post
+    in another tick waits instead of going out as well.
+    """
+    # Gallery items are not matched one by one; the album goes out as a whole
+    if tick.gallery:
+        return False
+    original, sent = media_hash_index.reserve(tick.phash, tick.post.id)
+    if not original:
+        if tick.phash is not None:
+            tick.hash_reservations.append(tick.post.id)
+        return False
+    if not sent:
+        # Not recorded: if that send fails, this post is still a candidate next time
+        logging.info(f"Post {tick.post.id} matches {original}, which is being sent right now, skipping")
+        tick.close_current_media()
+        return True
+    logging.info(f"Post {tick.post.id} looks like a repost of {original}, skipping")
+    metrics.skipped_posts_total.inc(subreddit=tick.subreddit_name, reason='repost')
+    DatabaseOperations.add_sent_post(tick.post.id, tick.subreddit_name, phash=tick.phash, duplicate_of=original)
+    candidate_queues.discard(tick.key, tick.post.id)
+    tick.close_current_media()
+    return True
+
+def next_media(tick):
+    """Where a tick goes once its current media item was collected or skipped"""
+    if len(tick.batch) >= MEDIA_GROUP_MAX:
+        return 'upload'
+    if tick.pending_media:
+        tick.media_url, tick.is_video = tick.pending_media.pop(0)
+        return 'download'
+    if len(tick.batch) < config_batch_size(tick.config) and tick.candidates:
+        return 'resolve'
+    return 'upload' if tick.batch else 'resolve'
+
+def skip_media(tick):
+    """Give up on the current media item; the post is dropped once none of its media made it"""
+    metrics.download_failures_total.inc(**download_labels(tick))
+    tick.close_current_media()
+    if not tick.pending_media and not any(item.post is tick.post for item in tick.batch):
+        candidate_queues.discard(tick.key, tick.post.id)
+    return next_media(tick)
+
+def collect_media(tick):
+    """Move the prepared media item into the tick's batch"""
+    first_of_post = not any(item.post is tick.post for item in tick.batch)
+    caption = None
+    if first_of_post:
+        caption = f"From r/{tick.subreddit_name}: {tick.post.title}\nUpvotes: {tick.post.score:,}"
+    tick.batch.append(MediaItem(
+        post=tick.post,
+        is_video=tick.is_video,
+        local_path=tick.local_path,
+        media_file=tick.media_file,
+        media_filename=tick.media_filename,
+        media_hash=tick.media_hash,
+        phash=tick.phash,
+        caption=caption
+    ))
+    # The item owns the buffer now
+    tick.media_file = None
+    tick.media_filename = None
+    return next_media(tick)
+
+def download_labels(tick):
+    return {'subreddit': tick.subreddit_name, 'media_type': 'video' if tick.is_video else 'image'}
+
+def observe_download(tick, started, source):
+    """Record the time and size of the media item just downloaded or relayed ('network') or taken from the cache ('cache')"""
+    labels = {**download_labels(tick), 'source': source}
+    metrics.download_seconds.observe(time.perf_counter() - started, **labels)
+    try:
+        if tick.media_file is not None:
+            size = tick.media_file.seek(0, os.SEEK_END)
+            tick.media_file.seek(0)
+        else:
+            size = os.path.getsize(tick.local_path)
+    except OSError:
+        return
+    metrics.download_bytes_total.inc(size, **labels)
+
+def download_stage(tick):
+    """Download the selected media, falling back to the next candidate on failure"""
+    tick.close_current_media()
+    tick.local_path = tick.media_hash = tick.phash = None
+    if media_hash_index.enabled and not tick.gallery:
+        # Compared by the preview hash the prefetcher queued with the candidate, before paying for the download
+        tick.phash = preview_hashes.get(tick.post.id)
+        if skip_repost(tick):
+            return next_media(tick)
+    started = time.perf_counter()
+    # Cached files are reused as-is; their reads are counted apart from network downloads
+    tick.local_path = media_cache.get(tick.media_url, pin=True)
+    source = 'cache' if tick.local_path else 'network'
+    if not tick.local_path and Config.MEDIA_RELAY_MODE == 'stream':
+        # Relayed without touching disk
+        try:
+            tick.media_file, tick.media_hash, tick.media_filename = relay_media(
+                tick.media_url, tick.post.id, is_video=tick.is_video
+            )
+        except MediaTooLarge:
+            logging.info(f"Media of post {tick.post.id} is too large to relay, downloading it instead")
+            tick.local_path = download_media(tick.media_url, tick.post.id, is_video=tick.is_video, pin=True)
+        else:
+            if not tick.media_file:
+                return skip_media(tick)
+            observe_download(tick, started, source)
+            if not tick.is_video and tick.phash is None and media_hash_index.enabled:
+                tick.media_file.seek(0)
+                tick.phash = dhash(tick.media_file)
+                if skip_repost(tick):
+                    return next_media(tick)
+            return collect_media(tick)
+    elif not tick.local_path:
+        tick.local_path = download_media(tick.media_url, tick.post.id, is_video=tick.is_video, pin=True)
+    if not tick.local_path:
+        return skip_media(tick)
+    tick.pinned_paths.append(tick.local_path)
+    observe_download(tick, started, source)
+    if not tick.is_video and tick.phash is None and media_hash_index.enabled:
+        tick.phash = dhash(tick.local_path)
+        if skip_repost(tick):
+            return next_media(tick)
+    tick.media_hash = media_cache.content_hash(tick.local_path)
+    return collect_media(tick)
+
+class TelegramBudgetTimeout(Exception):
+    """The chat's send budget stays paused longer than TELEGRAM_MAX_WAIT_SECONDS"""
+
+def upload_stage(tick):
+    """Send the collected media to the Telegram channel, as one album when there are several"""
+    items = tick.batch
+    known_file_ids = [telegram_file_ids.get(item.media_hash) for item in items]
+    post_ids = ', '.join(dict.fromkeys(item.post.id for item in items))
+    chat_limiter = telegram_limiters.get(TELEGRAM_CHANNEL_ID)
+    labels = {'subreddit': tick.subreddit_name, 'media_type': metrics.media_type(items)}
+    for attempt in range(TELEGRAM_FLOOD_RETRIES + 1):
+        # Bounded, so a long flood-control pause can't hold every upload worker
+        if chat_limiter.acquire(max_wait=Config.TELEGRAM_MAX_WAIT_SECONDS) is None:
+            if tick.inline:
+                # Nothing was sent; the caller (send-now) has to hear about it
+                raise TelegramBudgetTimeout(f"Telegram is rate limiting the channel, posts {post_ids} were not sent")
+            logging.warning(f"Telegram chat budget paused, leaving posts {post_ids} for the next tick")
+            return None
+        try:
+            with metrics.telegram_upload_seconds.time(**labels):
+                if len(items) > 1:
+                    file_ids = telegram_sender.run(send_telegram_media_group(
+                        chat_id=TELEGRAM_CHANNEL_ID,
+                        items=items,
+                        file_ids=known_file_ids
+                    ))
+                elif items[0].is_video:
+                    file_ids = [telegram_sender.run(send_telegram_video(
+                        chat_id=TELEGRAM_CHANNEL_ID,
+                        video_source=items[0].source,
+                        caption=items[0].caption,
+                        file_id=known_file_ids[0],
+                        filename=items[0].media_filename
+                    ))]
                 else:
-                    logging.info(f"Post {post.id} is not an image or video post, skipping")
-                    continue
+                    file_ids = [telegram_sender.run(send_telegram_photo(
+                        chat_id=TELEGRAM_CHANNEL_ID,
+                        photo_source=items[0].source,
+                        caption=items[0].caption,
+                        file_id=known_file_ids[0],
+                        filename=items[0].media_filename
+                    ))]
+            metrics.telegram_uploads_total.inc(outcome='ok', **labels)
+            break
+        except SendOutcomeUnknown as e:
+            metrics.telegram_uploads_total.inc(outcome='unknown', **labels)
+            # Trying the next candidate could post twice, so the batch counts as sent
+            logging.warning(f"{str(e)}; posts {post_ids} may have been sent, recording them as sent")
+            tick.sent = True
+            return 'record'
+        except RetryAfter as e:
+            metrics.telegram_uploads_total.inc(outcome='flood', **labels)
+            # Flood control applies to the whole chat, so hold off every sender to it
+            chat_limiter.pause(e.retry_after)
+            if attempt == TELEGRAM_FLOOD_RETRIES:
+                logging.warning(f"Telegram flood control persisted, leaving posts {post_ids} for the next tick")
+                return None
+        except Exception as e:
+            metrics.telegram_uploads_total.inc(outcome='error', **labels)
+            logging.error(f"Error sending posts {post_ids}: {str(e)}")
+            for item in items:
+                candidate_queues.discard(tick.key, item.post.id)
+            tick.close_media()
+            tick.batch = []
+            return 'resolve'
+    for item, file_id in zip(items, file_ids):
+        telegram_file_ids.put(item.media_hash, file_id, 'video' if item.is_video else 'photo')
+    tick.sent = True
+    return 'record'
 
-            if content_found:
-                DatabaseOperations.add_sent_post(post.id, subreddit_config['subreddit_name'])
-                logging.info(f"Successfully processed and recorded post {post.id}")
-                break
-                
-        if not content_found:
-            logging.warning(f"No suitable image or video posts found in r/{subreddit_config['subreddit_name']}")
-                
-        # Update last_check in Cosmos DB
-        subreddit_config['last_check'] = datetime.now().isoformat()
-        DatabaseOperations.update_config(subreddit_config['id'], subreddit_config)
-        logging.info(f"Updated last_check for {subreddit_config['subreddit_name']}")
+def record_stage(tick):
+    """Record the sent posts and the config's last check"""
+    if tick.sent:
+        recorded = set()
+        for item in tick.batch:
+            if item.post.id in recorded:
+                continue
+            recorded.add(item.post.id)
+            DatabaseOperations.add_sent_post(item.post.id, tick.subreddit_name, phash=item.phash)
+            candidate_queues.discard(tick.key, item.post.id)
+            logging.info(f"Successfully processed and recorded post {item.post.id}")
+    else:
+        logging.warning(f"No suitable image or video posts found in r/{tick.subreddit_name}")
+
+    # Update last_check in storage
+    DatabaseOperations.update_last_check(tick.config['id'])
+    logging.info(f"Updated last_check for {tick.subreddit_name}")
+    return None
+
+def finish_tick(tick):
+    """Release the tick's cached files and repost-index reservations, and record its metrics"""
+    for path in tick.pinned_paths:
+        media_cache.release(path)
+    for post_id in tick.hash_reservations:
+        media_hash_index.release(post_id)
+    metrics.observe_tick(tick, late_after=Config.PIPELINE_LATE_WARNING_SECONDS)
+
+pipeline = Pipeline(
+    stages=[
+        ('fetch', fetch_stage, Config.PIPELINE_FETCH_CONCURRENCY),
+        ('dedup', dedup_stage, Config.PIPELINE_DEDUP_CONCURRENCY),
+        ('resolve', resolve_stage, Config.PIPELINE_RESOLVE_CONCURRENCY),
+        ('download', download_stage, Config.PIPELINE_DOWNLOAD_CONCURRENCY),
+        ('upload', upload_stage, Config.PIPELINE_UPLOAD_CONCURRENCY),
+        ('record', record_stage, Config.PIPELINE_RECORD_CONCURRENCY)
+    ],
+    queue_size=Config.PIPELINE_QUEUE_SIZE,
+    late_warning_seconds=Config.PIPELINE_LATE_WARNING_SECONDS,
+    on_finish=lambda tick: finish_tick(tick)
+)
+pipeline.start()
+
+def send_to_telegram(subreddit_config):
+    """Run one tick for a config synchronously on the calling thread.
+
+    Returns False without sending if a tick for the config is already in flight.
+    """
+    try:
+        return pipeline.run_inline(Tick(subreddit_config))
     except Exception as e:
         logging.error(f"Error processing subreddit {subreddit_config['subreddit_name']}: {str(e)}")
         raise
 
-# Initialize scheduler
-scheduler = BackgroundScheduler()
+class DueTimeExecutor(ThreadPoolExecutor):
+    """Thread pool executor that remembers when each job's current run was due.
+
+    That is the job's next_run_time as the scheduler hands it over, before
+    advancing it: the first of any coalesced missed runs, with jitter
+    already applied, so neither skipped intervals nor jitter skew lateness.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._due_times = {}
+
+    def submit_job(self, job, run_times):
+        previous = self._due_times.get(job.id)
+        self._due_times[job.id] = (job.next_run_time or run_times[0]).timestamp()
+        try:
+            super().submit_job(job, run_times)
+        except Exception:
+            # max_instances reached: the running instance keeps its own due time
+            self._due_times[job.id] = previous
+            raise
+
+    def due_time(self, job_id):
+        return self._due_times.get(job_id)
+
+# Initialize scheduler; jobs only enqueue ticks, so missed runs are coalesced
+scheduler_executor = DueTimeExecutor()
+scheduler = BackgroundScheduler(executors={'default': scheduler_executor}, job_defaults={
+    'coalesce': True,
+    'max_instances': 1,
+    'misfire_grace_time': Config.SCHEDULER_MISFIRE_GRACE_SECONDS
+})
 scheduler.start()
 
+def count_misfire(event):
+    """Count runs APScheduler skipped because they could not start within the grace time"""
+    job = scheduler.get_job(event.job_id)
+    subreddit = job.args[0]['subreddit_name'] if job and job.args else ''
+    logging.warning(f"Scheduled run of {event.job_id} missed (due {event.scheduled_run_time})")
+    metrics.scheduler_misfires_total.inc(subreddit=subreddit)
+
+scheduler.add_listener(count_misfire, EVENT_JOB_MISSED)
+
+def collect_scheduler_metrics():
+    """Refresh the scheduler and pipeline gauges before a scrape"""
+    now = datetime.now().astimezone()
+    jobs = [job for job in scheduler.get_jobs() if job.id.startswith('subreddit_')]
+    metrics.scheduler_jobs.set(len(jobs))
+    metrics.scheduler_late_jobs.set(sum(1 for job in jobs if job.next_run_time and job.next_run_time < now))
+    stats = pipeline.stats()
+    for stage, queued in stats['queues'].items():
+        metrics.pipeline_queued_ticks.set(queued, stage=stage)
+    metrics.pipeline_in_flight.set(stats['in_flight'])
+
+metrics.registry.add_collector(collect_scheduler_metrics)
+
+def get_due_time(job_id):
+    """Timestamp at which the current run of a job was due"""
+    return scheduler_executor.due_time(job_id) or time.time()
+
+def enqueue_tick(config):
+    job_id = f"subreddit_{config['id']}"
+    pipeline.submit(Tick(config, due_at=get_due_time(job_id)))
+
+def phase_start_date(config_id, interval_seconds):
+    """Next run time at a stable offset within the interval, derived from the config id.
+
+    Configs sharing a frequency then fire spread across the interval instead
+    of all in the second they were scheduled, and keep their slot across restarts.
+    """
+    phase = int(hashlib.sha256(str(config_id).encode()).hexdigest(), 16) % interval_seconds
+    now = time.time()
+    start = now - ((now - phase) % interval_seconds) + interval_seconds
+    return datetime.fromtimestamp(start).astimezone()
+
 def schedule_subreddit(config):
     job_id = f"subreddit_{config['id']}"
+    interval_seconds = int(config['frequency']) * 60
     logging.info(f"Scheduling job for subreddit: {config['subreddit_name']} with frequency: {config['frequency']} minutes")
     scheduler.add_job(
-        send_to_telegram,
+        enqueue_tick,
         'interval',
         minutes=config['frequency'],
+        start_date=phase_start_date(config['id'], interval_seconds) if Config.SCHEDULER_SPREAD_PHASES else None,
+        jitter=Config.SCHEDULER_JITTER_SECONDS or None,
         id=job_id,
         replace_existing=True,
         args=[config]
     )
+    prefetcher.forget(job_id)
+
+def upcoming_ticks(lead_seconds):
+    """(job id, run time, config) for subreddit jobs due within lead_seconds"""
+    horizon = datetime.now().astimezone() + timedelta(seconds=lead_seconds)
+    for job in scheduler.get_jobs():
+        if job.id.startswith('subreddit_') and job.args and job.next_run_time and job.next_run_time <= horizon:
+            yield job.id, job.next_run_time, job.args[0]
+
+def candidate_media(post):
+    """(url, is_video) of every media item a candidate would send"""
+    if is_gallery_url(post.url):
+        return gallery_media(post)[:MEDIA_GROUP_MAX]
+    if is_image_url(post.url):
+        return [(post.url, False)]
+    url = get_video_url(post)
+    return [(url, True)] if url else []
+
+def prefetch_media(config, budget):
+    """Download the media of a config's next tick into the media cache, and hash its previews"""
+    fetched = False
+    for post in candidate_queues.take(config)[:config_batch_size(config)]:
+        if media_hash_index.enabled and not is_gallery_url(post.url) and preview_hashes.get(post.id) is None:
+            phash = preview_phash(post)
+            if phash is not None:
+                preview_hashes.set(post.id, phash)
+        for url, is_video in candidate_media(post):
+            if download_media(url, post.id, is_video=is_video, budget=budget) is not None:
+                fetched = True
+    return fetched
+
+prefetcher = MediaPrefetcher(
+    upcoming=upcoming_ticks,
+    prefetch=prefetch_media,
+    lead_seconds=Config.PREFETCH_LEAD_SECONDS,
+    concurrency=Config.PREFETCH_CONCURRENCY,
+    max_bytes_in_flight=Config.PREFETCH_MAX_BYTES_IN_FLIGHT,
+    unknown_size=Config.PREFETCH_UNKNOWN_SIZE_BYTES
+)
+if Config.REDDIT_BATCH_MODE:
+    scheduler.add_job(
+        listing_batcher.prefetch,
+        'interval',
+        seconds=Config.REDDIT_BATCH_SCAN_SECONDS,
+        id='listing_prefetch',
+        replace_existing=True
+    )
+
+if Config.PREFETCH_ENABLED:
+    scheduler.add_job(
+        prefetcher.scan,
+        'interval',
+        seconds=Config.PREFETCH_SCAN_SECONDS,
+        id='media_prefetch',
+        replace_existing=True
+    )
 
 @app.route('/api/subreddits/search', methods=['GET'])
 def search_subreddits():
@@ -302,6 +942,7 @@ def search_subreddits():
     
     try:
         subreddits = []
+        reddit_limiter.acquire()
         for subreddit in reddit.subreddits.search(query, limit=10):
             subreddits.append({
                 'name': subreddit.display_name,
@@ -316,19 +957,20 @@ def search_subreddits():
 
 @app.route('/api/configs', methods=['GET'])
 def get_configs():
-    logging.info("GET /api/configs - Fetching all subreddit configurations...")
+    logging.debug("GET /api/configs - Fetching all subreddit configurations...")
     try:
-        if not cosmos_db.is_initialized:
-            logging.error("Cosmos DB is not initialized")
-            cosmos_db._initialize()
-            if not cosmos_db.is_initialized:
-                logging.error("Failed to initialize Cosmos DB")
+        if not db.is_initialized:
+            logging.error("Database is not initialized")
+            db._initialize()
+            if not db.is_initialized:
+                logging.error("Failed to initialize database")
                 return jsonify({'error': 'Database connection failed'}), 500
 
         configs = DatabaseOperations.get_all_configs()
-        logging.info(f"Successfully retrieved {len(configs)} configurations")
-        for config in configs:
-            logging.info(f"Config: {config}")
+        logging.debug(f"Successfully retrieved {len(configs)} configurations")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            for config in configs:
+                logging.debug(f"Config: {config}")
         
         response = make_response(jsonify(configs))
         response.headers.add('Access-Control-Allow-Origin', '*')
@@ -345,12 +987,18 @@ def add_config():
     data = request.json
     logging.info(f"Adding new subreddit configuration: {data}")
     
-    config = DatabaseOperations.add_subreddit_config(data)
+    try:
+        config = DatabaseOperations.add_subreddit_config(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     logging.info(f"Successfully added configuration for r/{config['subreddit_name']}")
     
     try:
         logging.info(f"Attempting to send first image for r/{config['subreddit_name']}")
-        send_to_telegram(config)
+        try:
+            send_to_telegram(config)
+        except TelegramBudgetTimeout as e:
+            logging.warning(f"First send for r/{config['subreddit_name']} left to the schedule: {str(e)}")
         schedule_subreddit(config)
         logging.info(f"Successfully set up scheduling for r/{config['subreddit_name']}")
     except Exception as e:
@@ -363,7 +1011,11 @@ def update_config(config_id):
     data = request.json
     logging.info(f"Updating configuration ID: {config_id}")
     
-    config = DatabaseOperations.update_config(config_id, data)
+    try:
+        config = DatabaseOperations.update_config(config_id, data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    candidate_queues.drop(config_id)
     
     if config['is_active']:
         schedule_subreddit(config)
@@ -375,8 +1027,10 @@ def delete_config(config_id):
     logging.info(f"Deleting configuration ID: {config_id}")
     
     DatabaseOperations.delete_config(config_id)
+    candidate_queues.drop(config_id)
     
     job_id = f"subreddit_{config_id}"
+    prefetcher.forget(job_id)
     if scheduler.get_job(job_id):
         scheduler.remove_job(job_id)
         logging.info(f"Removed scheduler job for config ID: {config_id}")
@@ -392,12 +1046,16 @@ def toggle_config(config_id):
     if config['is_active']:
         try:
             logging.info(f"Attempting to send image for reactivated r/{config['subreddit_name']}")
-            send_to_telegram(config)
+            try:
+                send_to_telegram(config)
+            except TelegramBudgetTimeout as e:
+                logging.warning(f"First send for r/{config['subreddit_name']} left to the schedule: {str(e)}")
             schedule_subreddit(config)
             logging.info(f"Successfully set up scheduling for reactivated r/{config['subreddit_name']}")
         except Exception as e:
             logging.error(f"Error in reactivation setup for r/{config['subreddit_name']}: {str(e)}")
     else:
+        prefetcher.forget(job_id)
         if scheduler.get_job(job_id):
             scheduler.remove_job(job_id)
             logging.info(f"Removed scheduler job for deactivated r/{config['subreddit_name']}")
@@ -406,52 +1064,152 @@ def toggle_config(config_id):
 
 @app.route('/api/configs/<config_id>/send-now', methods=['POST'])
 def send_now(config_id):
-    configs = DatabaseOperations.get_all_configs()
-    config = next((c for c in configs if c['id'] == str(config_id)), None)
+    config = DatabaseOperations.get_config(config_id)
     if not config:
         return jsonify({'error': 'Config not found'}), 404
     if not config['is_active']:
         return jsonify({'error': 'Config is not active'}), 400
     
     try:
-        send_to_telegram(config)
+        if not send_to_telegram(config):
+            return jsonify({'error': 'A send for this config is already in progress'}), 409
         return jsonify({'message': 'Content sent successfully'})
+    except TelegramBudgetTimeout as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         logging.error(f"Error in send-now for r/{config['subreddit_name']}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/pipeline/stats', methods=['GET'])
+def get_pipeline_stats():
+    return jsonify(pipeline.stats())
+
+@app.route('/api/prefetch/stats', methods=['GET'])
+def get_prefetch_stats():
+    return jsonify(prefetcher.stats())
+
+@app.route('/api/candidates/stats', methods=['GET'])
+def get_candidate_stats():
+    return jsonify(candidate_queues.stats())
+
+@app.route('/api/listing_cache/stats', methods=['GET'])
+def get_listing_cache_stats():
+    stats = listing_cache.stats()
+    if Config.REDDIT_BATCH_MODE:
+        stats['batch'] = listing_batcher.stats()
+    return jsonify(stats)
+
+@app.route('/api/media_dedup/stats', methods=['GET'])
+def get_media_dedup_stats():
+    return jsonify(media_hash_index.stats())
+
+@app.route('/api/rate_limits/stats', methods=['GET'])
+def get_rate_limit_stats():
+    return jsonify(rate_limit_stats())
+
+@app.route('/api/cosmos/stats', methods=['GET'])
+def get_cosmos_stats():
+    """Request units, latency and throttling per Cosmos operation since start or the last reset"""
+    return jsonify({'storage_backend': Config.STORAGE_BACKEND, **cosmos_request_stats.snapshot()})
+
+@app.route('/api/cosmos/stats/reset', methods=['POST'])
+def reset_cosmos_stats():
+    cosmos_request_stats.reset()
+    return jsonify({'message': 'Cosmos request statistics reset'})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/media_cache/stats', methods=['GET'])
+def get_media_cache_stats():
+    return jsonify(media_cache.stats())
+
+def encode_cursor(cursor):
+    if not cursor:
+        return None
+    last_ts, ids = cursor
+    payload = json.dumps({'ts': last_ts, 'ids': ids}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(token):
+    if not token:
+        return None
+    payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+    return int(payload['ts']), [str(post_id) for post_id in payload['ids']]
+
+def parse_since(value):
+    """Epoch seconds or an ISO 8601 datetime, as epoch seconds"""
+    if not value:
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp())
+
 @app.route('/api/sent_posts/recent', methods=['GET'])
 def get_recent_sent_posts():
+    """Sent posts, newest first, streamed page by page.
+
+    Query parameters: limit, since (epoch seconds or ISO datetime),
+    subreddit and continuation. Without continuation the response is a
+    plain JSON list, as it always was. With it (empty for the first page),
+    it is {"posts": [...], "continuation": <cursor for the next page or null>}.
+    """
     try:
-        # Query all sent posts ordered by timestamp
-        query = "SELECT * FROM c ORDER BY c._ts DESC"
-        
-        results = list(cosmos_db.sent_posts_container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
-        
-        # Convert timestamps to readable format
-        for result in results:
-            if '_ts' in result:
-                result['sent_at_readable'] = datetime.fromtimestamp(result['_ts']).isoformat()
-        
-        return jsonify(results)
-    except Exception as e:
-        logging.error(f"Error getting recent sent posts: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        limit = min(max(int(request.args.get('limit', Config.SENT_POSTS_DEFAULT_LIMIT)), 1), Config.SENT_POSTS_MAX_LIMIT)
+        since_ts = parse_since(request.args.get('since'))
+        subreddit_name = request.args.get('subreddit') or None
+        paged = 'continuation' in request.args
+        cursor = decode_cursor(request.args.get('continuation'))
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': f"Invalid parameter: {str(e)}"}), 400
+
+    def fetch_page(cursor, remaining):
+        return DatabaseOperations.get_recent_sent_posts(
+            min(remaining, Config.SENT_POSTS_PAGE_SIZE),
+            since_ts=since_ts,
+            subreddit_name=subreddit_name,
+            cursor=cursor
+        )
+
+    # The first page is fetched up front so a failing query still gets an error status
+    posts, next_cursor = fetch_page(cursor, limit)
+    if posts is None:
+        return jsonify({'error': 'Could not load sent posts'}), 500
+
+    def generate(posts, cursor):
+        yield '{"posts":[' if paged else '['
+        sent = 0
+        while True:
+            for post in posts:
+                # Convert timestamps to readable format
+                post['sent_at_readable'] = datetime.fromtimestamp(post['_ts']).isoformat()
+                yield (',' if sent else '') + json.dumps(post)
+                sent += 1
+            if not cursor or sent >= limit:
+                break
+            posts, next_cursor = fetch_page(cursor, limit - sent)
+            if posts is None:
+                # Hand back the last good position so the client can resume
+                break
+            cursor = next_cursor
+        yield ('],"continuation":' + json.dumps(encode_cursor(cursor)) + '}') if paged else ']'
+
+    return Response(stream_with_context(generate(posts, next_cursor)), mimetype='application/json')
 
 if __name__ == '__main__':
-    os.makedirs('downloads/pics', exist_ok=True)
-    os.makedirs('downloads/videos', exist_ok=True)
-    
-    # Initialize Cosmos DB
-    if not cosmos_db.is_initialized:
-        cosmos_db._initialize()
-        if not cosmos_db.is_initialized:
-            logging.error("Failed to initialize Cosmos DB")
+    # Initialize the database
+    if not db.is_initialized:
+        db._initialize()
+        if not db.is_initialized:
+            logging.error("Failed to initialize database")
             exit(1)
-    
+
+    # Load already-sent post ids so duplicate checks stay in memory
+    DatabaseOperations.warm_dedup_index()
+
     # Schedule active configs
     active_configs = [c for c in DatabaseOperations.get_all_configs() if c['is_active']]
     for config in active_configs:
@@ -0,0 +1,290 @@
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+import httpx
+from background_loop import BackgroundLoop
+from config import Config
+from http_client import RETRY_STATUSES
+
+logger = logging.getLogger(__name__)
+
+class DownloadError(Exception):
+    pass
+
+class BudgetExceeded(DownloadError):
+    pass
+
+class ContentChanged(DownloadError):
+    pass
+
+class AsyncDownloader:
+    """Concurrent media downloads on one background event loop.
+
+    Servers that honour Range requests get large files fetched as parallel
+    segments, and a failed transfer resumes from the bytes already on disk
+    instead of starting over. Data is flushed in chunks that grow while the
+    connection keeps up, and the finished file must match the advertised
+    Content-Length. Partial files are only resumed while the server still
+    reports the same size and ETag/Last-Modified (sent back as If-Range).
+    """
+
+    def __init__(self, max_concurrent, segments, segment_min_bytes, chunk_min, chunk_max,
+                 connect_timeout, read_timeout, max_retries, backoff_base, backoff_max):
+        self.max_concurrent = max_concurrent
+        self.segments = max(segments, 1)
+        self.segment_min_bytes = segment_min_bytes
+        self.chunk_min = chunk_min
+        self.chunk_max = chunk_max
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._loop = BackgroundLoop('async-downloader')
+        self._lock = threading.Lock()
+        self._client = None
+        self._semaphore = None
+        self._active = {}  # dest_path -> Future, so two callers never write one part file
+
+    def start(self):
+        with self._lock:
+            if self._loop.is_running:
+                return
+            self._loop.start()
+            self._loop.submit(self._open()).result()
+            logger.info("Async downloader started")
+
+    async def _open(self):
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            follow_redirects=True,
+            headers={'User-Agent': 'RedditTelegramBot/1.0', 'Accept-Encoding': 'identity'},
+            limits=httpx.Limits(max_connections=self.max_concurrent * self.segments)
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+    def download(self, url, dest_path, budget=None, finish=None, timeout=None):
+        """Download url to dest_path from any thread.
+
+        Returns finish(dest_path) when given (run once, off the event loop),
+        otherwise the number of bytes. Concurrent calls for the same
+        dest_path share one download and its result.
+        """
+        self.start()
+        with self._lock:
+            future = self._active.get(dest_path)
+            if future is None:
+                future = self._loop.submit(self._download(url, dest_path, budget, finish))
+                self._active[dest_path] = future
+                future.add_done_callback(lambda f: self._forget(dest_path, f))
+        return future.result(timeout)
+
+    def _forget(self, dest_path, future):
+        with self._lock:
+            if self._active.get(dest_path) is future:
+                del self._active[dest_path]
+
+    async def _download(self, url, dest_path, budget, finish):
+        async with self._semaphore:
+            total, accepts_ranges, validator = await self._probe(url)
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._check_partial, dest_path, total, validator
+            )
+            reserved = 0
+            if budget is not None:
+                reserved = budget.try_reserve(total)
+                if not reserved:
+                    raise BudgetExceeded(url)
+            try:
+                started = time.monotonic()
+                if accepts_ranges and total and total >= self.segment_min_bytes * 2 and self.segments > 1:
+                    await self._download_segments(url, dest_path, total, validator)
+                else:
+                    await self._download_range(
+                        url, dest_path, 0, total - 1 if total else None, ranged=accepts_ranges, validator=validator
+                    )
+
+                size = os.path.getsize(dest_path)
+                if total is not None and size != total:
+                    os.remove(dest_path)
+                    raise DownloadError(f"Expected {total} bytes from {url}, got {size}")
+                self._remove(self._meta_path(dest_path))
+                logger.info(f"Downloaded {size} bytes in {time.monotonic() - started:.1f}s from {url}")
+                if finish is not None:
+                    return await asyncio.get_running_loop().run_in_executor(None, finish, dest_path)
+                return size
+            finally:
+                if reserved:
+                    budget.release(reserved)
+
+    async def _probe(self, url):
+        """Return (total size or None, whether Range requests are honoured, ETag/Last-Modified or None)"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._client.stream('GET', url, headers={'Range': 'bytes=0-0'}) as response:
+                    response.raise_for_status()
+                    validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                    if response.status_code == 206:
+                        content_range = response.headers.get('Content-Range', '')
+                        total = content_range.rsplit('/', 1)[-1]
+                        return (int(total) if total.isdigit() else None), True, validator
+                    length = response.headers.get('Content-Length')
+                    return (int(length) if length and length.isdigit() else None), False, validator
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if attempt == self.max_retries or not self._retryable(e):
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Probe of {url} failed ({str(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def _check_partial(self, dest_path, total, validator):
+        """Discard partial files left by a download of different content.
+
+        Resuming needs the same size and a validator to send as If-Range;
+        the pair is kept next to the partial file while it is incomplete.
+        """
+        meta_path = self._meta_path(dest_path)
+        current = f"{total}\n{validator}" if total and validator else None
+        try:
+            with open(meta_path) as f:
+                previous = f.read()
+        except OSError:
+            previous = None
+        if current is None or previous != current:
+            directory, prefix = os.path.split(dest_path)
+            for name in os.listdir(directory or '.'):
+                if name == prefix or name.startswith(prefix + '.seg'):
+                    self._remove(os.path.join(directory, name))
+        if current is None:
+            self._remove(meta_path)
+        elif previous != current:
+            with open(meta_path, 'w') as f:
+                f.write(current)
+
+    @staticmethod
+    def _meta_path(dest_path):
+        return dest_path + '.meta'
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _retryable(error):
+        return not isinstance(error, httpx.HTTPStatusError) or error.response.status_code in RETRY_STATUSES
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _download_segments(self, url, dest_path, total, validator):
+        segment_size = -(-total // self.segments)
+        parts = []
+        for i in range(self.segments):
+            start = i * segment_size
+            if start >= total:
+                break
+            end = min(start + segment_size, total) - 1
+            parts.append((f"{dest_path}.seg{i}", start, end))
+
+        await asyncio.gather(*[
+            self._download_range(url, part_path, start, end, ranged=True, validator=validator)
+            for part_path, start, end in parts
+        ])
+
+        def join_parts():
+            with open(dest_path, 'wb') as out:
+                for part_path, _, _ in parts:
+                    with open(part_path, 'rb') as part:
+                        while True:
+                            block = part.read(self.chunk_max)
+                            if not block:
+                                break
+                            out.write(block)
+                    os.remove(part_path)
+
+        await asyncio.get_running_loop().run_in_executor(None, join_parts)
+
+    async def _download_range(self, url, path, start, end, ranged, validator=None):
+        """Download bytes start..end (inclusive, end None = to EOF) into path, resuming on failure"""
+        expected = end - start + 1 if end is not None else None
+        for attempt in range(self.max_retries + 1):
+            have = os.path.getsize(path) if os.path.exists(path) else 0
+            if expected is not None and have >= expected:
+                return
+            if have and not ranged:
+                # No Range support: a retry has to start from scratch
+                os.remove(path)
+                have = 0
+
+            headers = {}
+            if ranged:
+                headers['Range'] = f"bytes={start + have}-{'' if end is None else end}"
+                if have and validator:
+                    # Full body instead of a range if the content changed since the partial file
+                    headers['If-Range'] = validator
+            try:
+                async with self._client.stream('GET', url, headers=headers) as response:
+                    response.raise_for_status()
+                    if ranged and response.status_code != 206:
+                        self._remove(path)
+                        if 'If-Range' in headers:
+                            # The other parts may hold the old content too; the next download starts over
+                            raise ContentChanged(f"{url} changed since the partial download")
+                        raise DownloadError(f"Server ignored Range request for {url}")
+                    await self._write_body(response, path, append=bool(have))
+                if expected is None or os.path.getsize(path) >= expected:
+                    return
+                raise DownloadError(f"Connection closed early for {url}")
+            except (httpx.TransportError, httpx.HTTPStatusError, DownloadError) as e:
+                if attempt == self.max_retries or isinstance(e, ContentChanged) or not self._retryable(e):
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Download of {url} interrupted ({str(e)}), resuming in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _write_body(self, response, path, append):
+        loop = asyncio.get_running_loop()
+        chunk_size = self.chunk_min
+        buffer = bytearray()
+        filled_since = time.monotonic()
+        with open(path, 'ab' if append else 'wb') as f:
+            async for data in response.aiter_bytes():
+                buffer += data
+                if len(buffer) < chunk_size:
+                    continue
+                # Grow the flush size while chunks fill quickly, shrink it when they don't
+                elapsed = time.monotonic() - filled_since
+                if elapsed < 0.05:
+                    chunk_size = min(chunk_size * 2, self.chunk_max)
+                elif elapsed > 0.5:
+                    chunk_size = max(chunk_size // 2, self.chunk_min)
+                await loop.run_in_executor(None, f.write, bytes(buffer))
+                buffer.clear()
+                filled_since = time.monotonic()
+            if buffer:
+                await loop.run_in_executor(None, f.write, bytes(buffer))
+
+    @staticmethod
+    def part_path(parts_dir, url):
+        """Stable temp path for a URL, so a retried download can resume"""
+        return os.path.join(parts_dir, hashlib.sha256(url.encode()).hexdigest() + '.part')
+
+# Create a singleton instance
+async_downloader = AsyncDownloader(
+    max_concurrent=Config.ASYNC_DOWNLOAD_CONCURRENCY,
+    segments=Config.ASYNC_DOWNLOAD_SEGMENTS,
+    segment_min_bytes=Config.ASYNC_DOWNLOAD_SEGMENT_MIN_BYTES,
+    chunk_min=Config.ASYNC_DOWNLOAD_CHUNK_MIN_BYTES,
+    chunk_max=Config.ASYNC_DOWNLOAD_CHUNK_MAX_BYTES,
+    connect_timeout=Config.HTTP_CONNECT_TIMEOUT,
+    read_timeout=Config.HTTP_READ_TIMEOUT,
+    max_retries=Config.HTTP_MAX_RETRIES,
+    backoff_base=Config.HTTP_BACKOFF_BASE,
+    backoff_max=Config.HTTP_BACKOFF_MAX
+)
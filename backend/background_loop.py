@@ -0,0 +1,43 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class BackgroundLoop:
+    """An asyncio event loop running forever in its own daemon thread"""
+
+    def __init__(self, name):
+        self.name = name
+        self.loop = None
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self.loop is not None
+
+    def start(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=self._run, args=(loop,), name=self.name, daemon=True)
+        thread.start()
+        self.loop = loop
+        self._thread = thread
+
+    @staticmethod
+    def _run(loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule a coroutine from any thread; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        if self.loop is None:
+            return
+        loop, thread = self.loop, self._thread
+        self.loop = None
+        self._thread = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=10)
+        loop.close()
@@ -0,0 +1,779 @@
+"""End-to-end benchmark of the send pipeline and the Flask routes, against local stand-ins.
+
+    python benchmark.py list
+    python benchmark.py run [-s configs_10 -s slow_cdn] [-o results.json] [--baseline old.json]
+    python benchmark.py compare old.json new.json [--threshold 0.2]
+
+`run` serves local fakes of Reddit (OAuth and listings), the Telegram Bot
+API, the Redgifs API and a media CDN from this process, then runs every
+scenario in a fresh worker process pointed at them through Config's
+endpoint settings, with storage on a SQLite file in its temp dir. Each
+scenario reports tick throughput, p50/p95/p99 latency per pipeline stage,
+inline send_to_telegram and route latency, and peak memory. With
+REDDIT_BATCH_MODE, listings are prefetched before each round as the
+scheduler job would, and that time is reported apart from the rounds. Results are
+written as JSON; `compare` (or `run --baseline`) lists the metrics that got
+worse by more than the threshold and exits non-zero if there are any.
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import platform
+import queue
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Every scenario starts from these; sizes in bytes, latencies in seconds, bandwidth in bytes/s (0 = unlimited)
+SCENARIO_DEFAULTS = {
+    'configs': 10,
+    'rounds': 2,  # ticks per config; later rounds run with warm listing caches
+    'media': 'image',  # image, video, redgifs, gallery or mixed
+    'batch_size': 1,
+    'duplicate_ratio': 0.0,  # share of listed posts already recorded as sent
+    'posts_per_listing': 50,
+    'image_bytes': 200 * 1024,
+    'video_bytes': 5 * 1024 ** 2,
+    'reddit_latency': 0.05,
+    'telegram_latency': 0.02,
+    'redgifs_latency': 0.02,
+    'cdn_latency': 0.0,
+    'cdn_bandwidth': 0,
+    'inline_samples': 5,
+    'route_requests': 50,
+    'env': {}
+}
+
+SCENARIOS = {
+    'configs_10': {'configs': 10},
+    'configs_100': {'configs': 100},
+    'configs_1000': {'configs': 1000, 'rounds': 1, 'route_requests': 20},
+    'large_videos': {'configs': 8, 'rounds': 1, 'media': 'video', 'video_bytes': 40 * 1024 ** 2},
+    'high_duplicates': {'configs': 100, 'duplicate_ratio': 0.9},
+    'slow_cdn': {'configs': 20, 'cdn_latency': 0.3, 'cdn_bandwidth': 1024 ** 2, 'image_bytes': 512 * 1024},
+    'redgifs': {'configs': 20, 'media': 'redgifs', 'video_bytes': 2 * 1024 ** 2},
+    'albums': {'configs': 20, 'batch_size': 5},
+    'mixed_media': {'configs': 40, 'media': 'mixed', 'video_bytes': 2 * 1024 ** 2},
+    'stream_relay': {'configs': 20, 'env': {'MEDIA_RELAY_MODE': 'stream'}},
+    # Same load as mixed_media, with listings prefetched in multireddit calls
+    'batched_listings': {'configs': 40, 'media': 'mixed', 'video_bytes': 2 * 1024 ** 2,
+                         'env': {'REDDIT_BATCH_MODE': 'true'}}
+}
+
+ROUTES = ['/api/configs', '/api/sent_posts/recent?limit=50', '/api/pipeline/stats', '/metrics']
+
+def scenario_params(name):
+    return {**SCENARIO_DEFAULTS, **SCENARIOS[name]}
+
+def subreddit_name(index):
+    return f"bench{index:04d}"
+
+def post_id(subreddit, index):
+    return f"{subreddit}p{index:03d}"
+
+def is_preseeded(pid, ratio):
+    """Whether a listed post counts as already sent in a scenario (stable across processes)"""
+    return zlib.crc32(pid.encode()) % 1000 < ratio * 1000
+
+def percentiles(values):
+    """count/mean/p50/p95/p99/max of durations in seconds, reported in milliseconds"""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(int(len(ordered) * p), len(ordered) - 1)] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50': round(rank(0.50), 3),
+        'p95': round(rank(0.95), 3),
+        'p99': round(rank(0.99), 3),
+        'max': round(ordered[-1] * 1000, 3)
+    }
+
+# Local stand-ins
+
+class FakeServices:
+    """Reddit, Telegram Bot API, Redgifs and media CDN stand-ins on one local HTTP server.
+
+    Paths mirror the real services closely enough for PRAW, python-telegram-bot
+    and our own clients: /api/v1/access_token and /r/<names>/top (Reddit),
+    /bot<token>/<method> (Telegram), /redgifs/v2/... (Redgifs) and
+    /cdn/img|vid/<name> (media, with Range support). configure() sets the
+    listing contents and the latencies of the scenario being run.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.params = dict(SCENARIO_DEFAULTS)
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._images = {}
+        self._message_id = 0
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                services._dispatch(self)
+
+            def do_POST(self):
+                services._dispatch(self)
+
+            def do_HEAD(self):
+                services._dispatch(self, head=True)
+
+            def log_message(self, format, *args):
+                pass
+
+        ThreadingHTTPServer.request_queue_size = 256
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, name='benchmark-fakes', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def configure(self, params):
+        with self._lock:
+            self.params = params
+            self._counters = {}
+
+    def counters(self):
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    # Request handling
+
+    def _dispatch(self, handler, head=False):
+        path = urlparse(handler.path).path
+        try:
+            body = self._read_body(handler)
+            if path == '/api/v1/access_token':
+                self._count('reddit.token')
+                return self._json(handler, {
+                    'access_token': 'bench', 'token_type': 'bearer', 'expires_in': 86400, 'scope': '*'
+                })
+            if path.startswith('/r/'):
+                return self._reddit_listing(handler, path)
+            if path.startswith('/bot'):
+                return self._telegram(handler, path, body)
+            if path.startswith('/redgifs/'):
+                return self._redgifs(handler, path)
+            if path.startswith('/cdn/'):
+                return self._cdn(handler, path, head)
+            self._json(handler, {'error': 'not found'}, status=404)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    @staticmethod
+    def _read_body(handler):
+        """Drain the request body, keeping only its head (form fields come before uploaded files)"""
+        remaining = int(handler.headers.get('Content-Length') or 0)
+        head = b''
+        while remaining > 0:
+            chunk = handler.rfile.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            if len(head) < 256 * 1024:
+                head += chunk[:256 * 1024 - len(head)]
+        return head
+
+    @staticmethod
+    def _json(handler, payload, status=200):
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _reddit_listing(self, handler, path):
+        params = self.params
+        time.sleep(params['reddit_latency'])
+        query = parse_qs(urlparse(handler.path).query)
+        # Reddit serves at most 100 posts per page
+        limit = min(int(query.get('limit', ['25'])[0]), 100)
+        names = path.split('/')[2].split('+')
+        self._count('reddit.listing')
+
+        # A multireddit interleaves its subreddits' posts
+        children = []
+        for index in range(params['posts_per_listing']):
+            for name in names:
+                children.append({'kind': 't3', 'data': self._post(name, index)})
+        # Paged like Reddit: `after` is the fullname of the last post of the previous page
+        after = query.get('after', [None])[0]
+        start = next((i + 1 for i, child in enumerate(children) if child['data']['name'] == after), 0)
+        page = children[start:start + limit]
+        more = start + limit < len(children)
+        self._json(handler, {
+            'kind': 'Listing',
+            'data': {'after': page[-1]['data']['name'] if more and page else None, 'before': None,
+                     'dist': len(page), 'children': page}
+        })
+
+    def _post(self, subreddit, index):
+        pid = post_id(subreddit, index)
+        media = self.params['media']
+        if media == 'mixed':
+            media = ('image', 'video', 'redgifs', 'gallery')[index % 4]
+        data = {
+            'id': pid,
+            'name': f"t3_{pid}",
+            'title': f"Benchmark post {index} of r/{subreddit}",
+            'score': 10000 - index,
+            'subreddit': subreddit,
+            'created_utc': time.time() - index * 60,
+            'permalink': f"/r/{subreddit}/comments/{pid}/",
+            'over_18': False,
+            'is_video': False,
+            'media': None,
+            'url': f"{self.url}/cdn/img/{pid}.jpg",
+            'preview': {'images': [{'source': {'url': f"{self.url}/cdn/img/{pid}-preview.jpg"}}]}
+        }
+        if media == 'video':
+            data['is_video'] = True
+            data['url'] = f"https://v.redd.it/{pid}"
+            data['media'] = {'reddit_video': {'fallback_url': f"{self.url}/cdn/vid/{pid}.mp4"}}
+        elif media == 'redgifs':
+            data['url'] = f"https://www.redgifs.com/watch/{pid}"
+        elif media == 'gallery':
+            data['url'] = f"https://www.reddit.com/gallery/{pid}"
+            items = [f"{pid}g{n}" for n in range(3)]
+            data['gallery_data'] = {'items': [{'media_id': item} for item in items]}
+            data['media_metadata'] = {
+                item: {'status': 'valid', 's': {'u': f"{self.url}/cdn/img/{item}.jpg"}} for item in items
+            }
+        return data
+
+    def _telegram(self, handler, path, body):
+        params = self.params
+        method = path.rsplit('/', 1)[-1]
+        self._count(f"telegram.{method}")
+        if method in ('getMe', 'get_me'):
+            return self._json(handler, {'ok': True, 'result': {
+                'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'
+            }})
+        if method in ('deleteWebhook', 'close', 'logOut'):
+            return self._json(handler, {'ok': True, 'result': True})
+
+        time.sleep(params['telegram_latency'])
+        if method == 'sendPhoto':
+            result = self._message('photo')
+        elif method == 'sendVideo':
+            result = self._message('video')
+        elif method == 'sendMediaGroup':
+            types = self._album_types(handler.headers.get('Content-Type', ''), body)
+            self._count('telegram.album_items', len(types))
+            result = [self._message(kind) for kind in types]
+        else:
+            return self._json(handler, {'ok': False, 'error_code': 404, 'description': 'Not Found'}, status=404)
+        self._json(handler, {'ok': True, 'result': result})
+
+    @staticmethod
+    def _album_types(content_type, body):
+        """Media types of a sendMediaGroup request, from its JSON, urlencoded or multipart body"""
+        media = None
+        if 'application/json' in content_type:
+            media = json.loads(body or b'{}').get('media')
+        elif 'x-www-form-urlencoded' in content_type:
+            media = parse_qs(body.decode()).get('media', [None])[0]
+        else:
+            match = re.search(rb'name="media"\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--', body, re.S)
+            media = match.group(1).decode() if match else None
+        if isinstance(media, str):
+            media = json.loads(media)
+        return [item.get('type', 'photo') for item in media or []] or ['photo']
+
+    def _message(self, kind):
+        with self._lock:
+            self._message_id += 1
+            message_id = self._message_id
+        file_id = f"bench-{kind}-{message_id}"
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': -1001, 'type': 'channel', 'title': 'Benchmark'}
+        }
+        if kind == 'video':
+            message['video'] = {
+                'file_id': file_id, 'file_unique_id': file_id, 'width': 640, 'height': 360, 'duration': 10
+            }
+        else:
+            message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 64, 'height': 64}]
+        return message
+
+    def _redgifs(self, handler, path):
+        time.sleep(self.params['redgifs_latency'])
+        if path.endswith('/auth/temporary'):
+            self._count('redgifs.token')
+            return self._json(handler, {'token': 'bench'})
+        self._count('redgifs.gif')
+        gif_id = path.rsplit('/', 1)[-1]
+        self._json(handler, {'gif': {'id': gif_id, 'urls': {
+            'hd': f"{self.url}/cdn/vid/{gif_id}.mp4",
+            'sd': f"{self.url}/cdn/vid/{gif_id}-sd.mp4"
+        }}})
+
+    def _image(self, name, size):
+        """A distinct noise JPEG per name (so perceptual hashes differ), padded to size"""
+        with self._lock:
+            data = self._images.get(name)
+        if data is None:
+            rng = random.Random(name)
+            if Image is not None:
+                image = Image.frombytes('L', (64, 64), bytes(rng.getrandbits(8) for _ in range(64 * 64)))
+                buffer = io.BytesIO()
+                image.convert('RGB').save(buffer, 'JPEG', quality=85)
+                data = buffer.getvalue()
+            else:
+                data = b'\xff\xd8\xff\xe0' + rng.randbytes(1024)
+            # Decoders stop at the end-of-image marker, so the padding is ignored
+            data += b'\0' * max(size - len(data), 0)
+            with self._lock:
+                if len(self._images) > 4096:
+                    self._images.clear()
+                self._images[name] = data
+        return data
+
+    def _cdn(self, handler, path, head):
+        params = self.params
+        kind, name = path.split('/')[2:4]
+        if kind == 'img':
+            size = params['image_bytes']
+            if name.endswith('-preview.jpg'):
+                size = 0
+            body = self._image(name, size)
+            size = len(body)
+            content_type = 'image/jpeg'
+        else:
+            size = params['video_bytes']
+            # Content differs per name, so every video gets its own content hash
+            body = hashlib.sha256(name.encode()).digest() * 2048
+            content_type = 'video/mp4'
+
+        start, end, status = 0, size - 1, 200
+        match = re.match(r'bytes=(\d*)-(\d*)', handler.headers.get('Range', ''))
+        if match and size:
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+            status = 206
+
+        time.sleep(params['cdn_latency'])
+        self._count(f"cdn.{kind}.requests")
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(end - start + 1))
+        handler.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            handler.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        handler.end_headers()
+        if head:
+            return
+
+        chunk_size = 64 * 1024
+        position = start
+        while position <= end:
+            length = min(chunk_size, end - position + 1)
+            if kind == 'img':
+                chunk = body[position:position + length]
+            else:
+                offset = position % len(body)
+                chunk = (body[offset:] + body)[:length]
+            handler.wfile.write(chunk)
+            position += length
+            if params['cdn_bandwidth']:
+                time.sleep(length / params['cdn_bandwidth'])
+        self._count(f"cdn.{kind}.bytes", end - start + 1)
+
+# Scenario worker (runs in its own process)
+
+def worker_env(params, fakes_url, workdir):
+    """Environment of a scenario worker: every service on the fakes, storage in the workdir"""
+    env = {
+        'STORAGE_BACKEND': 'sqlite',
+        'SQLITE_PATH': os.path.join(workdir, 'snoogram.db'),
+        'REDDIT_CLIENT_ID': 'bench',
+        'REDDIT_CLIENT_SECRET': 'bench',
+        'REDDIT_URL': fakes_url,
+        'REDDIT_OAUTH_URL': fakes_url,
+        'TELEGRAM_BOT_TOKEN': '123456:bench',
+        'TELEGRAM_CHANNEL_ID': '-1001',
+        'TELEGRAM_API_URL': f"{fakes_url}/bot",
+        'REDGIFS_API_URL': f"{fakes_url}/redgifs/v2",
+        'MEDIA_CACHE_DIR': os.path.join(workdir, 'cache'),
+        'PREFETCH_ENABLED': 'false',
+        # Measure our own code, not the configured service quotas
+        'REDDIT_RATE_PER_SECOND': '0',
+        'TELEGRAM_CHAT_RATE_PER_SECOND': '0',
+        'REDGIFS_RATE_PER_SECOND': '0',
+        'COSMOS_RATE_PER_SECOND': '0',
+        'SCHEDULER_JITTER_SECONDS': '0'
+    }
+    env.update({key: str(value) for key, value in params['env'].items()})
+    return env
+
+def apply_config(config_class, env):
+    """Force env values onto Config, over anything a local .env file set"""
+    for key, value in env.items():
+        current = getattr(config_class, key, None)
+        if isinstance(current, bool):
+            value = value.lower() == 'true'
+        elif isinstance(current, int):
+            value = int(value)
+        elif isinstance(current, float):
+            value = float(value)
+        setattr(config_class, key, value)
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024, 1)
+
+def run_worker(name, params, fakes_url, result_path, trace_memory, log_level):
+    workdir = tempfile.mkdtemp(prefix='snoogram-bench-')
+    env = worker_env(params, fakes_url, workdir)
+    env['LOG_LEVEL'] = log_level
+    os.environ.update(env)
+    os.environ['NO_PROXY'] = os.environ['no_proxy'] = '127.0.0.1,localhost'
+    os.environ['praw_check_for_updates'] = 'False'
+    # app.log and the media cache stay inside the scratch directory
+    os.chdir(workdir)
+    if trace_memory:
+        tracemalloc.start()
+
+    from config import Config
+    apply_config(Config, env)
+
+    started = time.perf_counter()
+    import app as snoogram
+    from db_operations import DatabaseOperations, db
+    from pipeline import Tick
+    startup = time.perf_counter() - started
+
+    if not db.is_initialized:
+        db._initialize()
+    configs = [
+        DatabaseOperations.add_subreddit_config({
+            'subreddit_name': subreddit_name(index),
+            'filter_type': 'top_day',
+            'frequency': 60,
+            'batch_size': params['batch_size']
+        })
+        for index in range(params['configs'])
+    ]
+    if params['duplicate_ratio']:
+        for config in configs:
+            for index in range(params['posts_per_listing']):
+                pid = post_id(config['subreddit_name'], index)
+                if is_preseeded(pid, params['duplicate_ratio']):
+                    DatabaseOperations.add_sent_post(pid, config['subreddit_name'])
+    DatabaseOperations.warm_dedup_index()
+
+    finished = queue.Queue()
+    snoogram.pipeline.add_finish_listener(finished.put)
+    stage_times = {}
+    tick_totals = []
+    rounds = []
+    ticks_run = sent = errors = incomplete = backpressure = 0
+    pipeline_wall = 0.0
+    listing_prefetch = 0.0
+
+    for round_number in range(params['rounds']):
+        if Config.REDDIT_BATCH_MODE:
+            # What the listing_prefetch job does ahead of scheduled ticks, so timed apart from the round
+            prefetch_started = time.perf_counter()
+            snoogram.listing_batcher.fetch_listings('top_day', [
+                config['subreddit_name'] for config in configs
+                if not snoogram.listing_cache.is_cached(config['subreddit_name'], 'top_day')
+            ])
+            listing_prefetch += time.perf_counter() - prefetch_started
+        round_started = time.perf_counter()
+        for config in configs:
+            # Keep every config in the run: wait for a queue slot instead of dropping the tick
+            while not snoogram.pipeline.submit(Tick(config)):
+                backpressure += 1
+                time.sleep(0.005)
+        done = 0
+        while done < len(configs):
+            try:
+                tick = finished.get(timeout=300)
+            except queue.Empty:
+                incomplete += len(configs) - done
+                break
+            done += 1
+            ticks_run += 1
+            sent += tick.sent
+            errors += tick.error is not None
+            tick_totals.append(tick.finished_at - tick.enqueued_at)
+            for stage, seconds in tick.timings:
+                stage_times.setdefault(stage, []).append(seconds)
+        wall = time.perf_counter() - round_started
+        pipeline_wall += wall
+        rounds.append({'seconds': round(wall, 3), 'ticks_per_second': round(done / wall, 2) if wall else None})
+
+    inline_times = []
+    inline_errors = 0
+    for config in configs[:params['inline_samples']]:
+        call_started = time.perf_counter()
+        try:
+            snoogram.send_to_telegram(config)
+        except Exception:
+            inline_errors += 1
+        inline_times.append(time.perf_counter() - call_started)
+
+    client = snoogram.app.test_client()
+    routes = {}
+    for route in ROUTES:
+        times, failures = [], 0
+        for _ in range(params['route_requests']):
+            call_started = time.perf_counter()
+            response = client.get(route)
+            response.get_data()
+            times.append(time.perf_counter() - call_started)
+            failures += response.status_code != 200
+        routes[route] = {**percentiles(times), 'errors': failures}
+
+    memory = {'peak_rss_mb': peak_rss_mb()}
+    if trace_memory:
+        memory['tracemalloc_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+
+    result = {
+        'params': params,
+        'startup_seconds': round(startup, 3),
+        'ticks': ticks_run,
+        'sent': sent,
+        'errors': errors,
+        'incomplete': incomplete,
+        'backpressure_retries': backpressure,
+        'pipeline_seconds': round(pipeline_wall, 3),
+        'listing_prefetch_seconds': round(listing_prefetch, 3),
+        'throughput_ticks_per_second': round(ticks_run / pipeline_wall, 2) if pipeline_wall else None,
+        'rounds': rounds,
+        'tick_total': percentiles(tick_totals),
+        'stages': {stage: percentiles(times) for stage, times in stage_times.items()},
+        'inline': {**percentiles(inline_times), 'errors': inline_errors},
+        'routes': routes,
+        'memory': memory
+    }
+    with open(result_path, 'w') as f:
+        json.dump(result, f)
+    from logging_setup import stop_logging
+    stop_logging()
+    shutil.rmtree(workdir, ignore_errors=True)
+    # Scheduler, pipeline and sender threads are not meant to be stopped; skip their atexit hooks
+    os._exit(0)
+
+# Runner and comparison
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+def run_scenario(fakes, name, params, args):
+    fakes.configure(params)
+    fd, result_path = tempfile.mkstemp(prefix=f"bench-{name}-", suffix='.json')
+    os.close(fd)
+    command = [
+        sys.executable, os.path.abspath(__file__), 'worker', name,
+        '--fakes', fakes.url, '--result', result_path,
+        '--params', json.dumps(params), '--log-level', args.log_level
+    ]
+    if args.tracemalloc:
+        command.append('--tracemalloc')
+    try:
+        process = subprocess.run(command, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, timeout=args.timeout)
+        if process.returncode != 0:
+            return {'params': params, 'failed': f"worker exited with {process.returncode}"}
+        with open(result_path) as f:
+            result = json.load(f)
+    except subprocess.TimeoutExpired:
+        return {'params': params, 'failed': f"timed out after {args.timeout}s"}
+    except (OSError, ValueError) as e:
+        return {'params': params, 'failed': str(e)}
+    finally:
+        os.remove(result_path)
+    result['requests'] = fakes.counters()
+    return result
+
+def run(args):
+    names = args.scenario or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(unknown)} (see `python benchmark.py list`)")
+        return 2
+    overrides = dict(item.split('=', 1) for item in args.env)
+
+    results = {
+        'meta': {
+            'created_at': datetime.now().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'env': overrides
+        },
+        'scenarios': {}
+    }
+    with FakeServices() as fakes:
+        for name in names:
+            params = scenario_params(name)
+            params['env'] = {**params['env'], **overrides}
+            print(f"Running {name}...", flush=True)
+            result = run_scenario(fakes, name, params, args)
+            results['scenarios'][name] = result
+            if 'failed' in result:
+                print(f"  FAILED: {result['failed']}")
+            else:
+                print(
+                    f"  {result['ticks']} ticks, {result['sent']} sent, {result['errors']} errors, "
+                    f"{result['throughput_ticks_per_second']} ticks/s, "
+                    f"tick p95 {result['tick_total'].get('p95')}ms, peak RSS {result['memory']['peak_rss_mb']}MB"
+                )
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        return 1 if report_comparison(baseline, results, args.threshold) else 0
+    return 0
+
+def comparable_metrics(result):
+    """(metric, value, higher_is_better, noise floor) of one scenario result"""
+    metrics = [('throughput_ticks_per_second', result.get('throughput_ticks_per_second'), True, 0)]
+    sections = [('tick_total', result.get('tick_total', {})), ('inline', result.get('inline', {}))]
+    sections += [(f"stages.{stage}", stats) for stage, stats in result.get('stages', {}).items()]
+    sections += [(f"routes.{route}", stats) for route, stats in result.get('routes', {}).items()]
+    for prefix, stats in sections:
+        for key in ('p50', 'p95', 'p99'):
+            # Sub-millisecond differences are timer noise
+            metrics.append((f"{prefix}.{key}", stats.get(key), False, 1.0))
+    for key, value in result.get('memory', {}).items():
+        metrics.append((f"memory.{key}", value, False, 5.0))
+    return metrics
+
+def compare_results(baseline, current, threshold):
+    """Rows of (scenario, metric, old, new, relative change, verdict) for metrics in both runs"""
+    rows = []
+    for name, result in current.get('scenarios', {}).items():
+        old_result = baseline.get('scenarios', {}).get(name)
+        if not old_result or 'failed' in old_result or 'failed' in result:
+            continue
+        old_metrics = {metric: value for metric, value, _, _ in comparable_metrics(old_result)}
+        for metric, new, higher_is_better, floor in comparable_metrics(result):
+            old = old_metrics.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            verdict = None
+            if abs(worse) > threshold and abs(new - old) > floor:
+                verdict = 'regression' if worse > 0 else 'improvement'
+            rows.append((name, metric, old, new, change, verdict))
+    return rows
+
+def report_comparison(baseline, current, threshold):
+    """Print the metrics that moved beyond the threshold; returns the regressions"""
+    rows = compare_results(baseline, current, threshold)
+    regressions = [row for row in rows if row[5] == 'regression']
+    for name, metric, old, new, change, verdict in rows:
+        if verdict:
+            print(f"{name:<18} {metric:<48} {old:>12} -> {new:<12} {change:+.1%} {verdict.upper()}")
+    print(f"{len(rows)} metrics compared, {len(regressions)} regressions (threshold {threshold:.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmark against local service stand-ins')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('list', help='list scenarios')
+
+    run_parser = commands.add_parser('run', help='run scenarios and save results')
+    run_parser.add_argument('-s', '--scenario', action='append', help='scenario to run (repeatable, default all)')
+    run_parser.add_argument('-o', '--output', default='benchmark_results.json')
+    run_parser.add_argument('--baseline', help='earlier results to compare against')
+    run_parser.add_argument('--threshold', type=float, default=0.2, help='relative change counted as a regression')
+    run_parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                            help='Config override for every scenario, e.g. PIPELINE_DOWNLOAD_CONCURRENCY=8')
+    run_parser.add_argument('--tracemalloc', action='store_true', help='also report the peak of Python allocations')
+    run_parser.add_argument('--timeout', type=int, default=1800, help='seconds per scenario')
+    run_parser.add_argument('--log-level', default='ERROR', help='app log level inside the workers')
+
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2)
+
+    worker_parser = commands.add_parser('worker')
+    worker_parser.add_argument('name')
+    worker_parser.add_argument('--fakes', required=True)
+    worker_parser.add_argument('--result', required=True)
+    worker_parser.add_argument('--params', required=True)
+    worker_parser.add_argument('--tracemalloc', action='store_true')
+    worker_parser.add_argument('--log-level', default='ERROR')
+
+    args = parser.parse_args()
+    if args.command == 'list':
+        for name in SCENARIOS:
+            print(f"{name:<18} {json.dumps(SCENARIOS[name])}")
+        return 0
+    if args.command == 'run':
+        return run(args)
+    if args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        return 1 if report_comparison(baseline, current, args.threshold) else 0
+    run_worker(args.name, json.loads(args.params), args.fakes, args.result, args.tracemalloc, args.log_level)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class _CandidateQueue:
+    def __init__(self, config, posts):
+        self.config = config
+        self.posts = deque(posts)
+        self.filled_at = time.time()
+
+class CandidateQueues:
+    """Ranked, already-deduplicated posts ready to send, kept per config.
+
+    `fill(config)` does the slow part (listing fetch, ranking, dedup and
+    media classification). A tick only takes what is queued; the queue is
+    refilled in the background once it drops below the low-water mark or
+    gets older than max_age, and only filled on the tick itself when empty.
+    A depth of 0 queues every candidate of the listing, so a tick can fall
+    back as far down it as an unqueued tick could.
+    """
+
+    def __init__(self, fill, depth, low_water, max_age, workers):
+        self._fill = fill
+        self.depth = depth
+        self.low_water = low_water
+        self.max_age = max_age
+        self._queues = {}
+        self._generations = {}  # config id -> bumped by drop(), so older refills are thrown away
+        self._refilling = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='candidate-refill')
+
+    def take(self, config):
+        """Return the queued candidates for a config, best first"""
+        key = str(config['id'])
+        with self._lock:
+            queue = self._queues.get(key)
+            posts = list(queue.posts) if queue else []
+            stale = queue is not None and time.time() - queue.filled_at > self.max_age
+
+        if not posts:
+            return self._refill(config)
+        if len(posts) < self.low_water or stale:
+            self._schedule_refill(config)
+        return posts
+
+    def discard(self, config_id, post_id):
+        """Remove a post that was sent or turned out to be unsendable"""
+        key = str(config_id)
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                return
+            queue.posts = deque(p for p in queue.posts if p.id != post_id)
+            config = queue.config
+            low = len(queue.posts) < self.low_water
+        if low:
+            self._schedule_refill(config)
+
+    def drop(self, config_id):
+        """Forget a config's queue, e.g. after its filter changed or it was deleted"""
+        key = str(config_id)
+        with self._lock:
+            self._queues.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _refill(self, config):
+        key = str(config['id'])
+        with self._lock:
+            generation = self._generations.get(key, 0)
+        posts = self._fill(config)
+        if self.depth:
+            posts = posts[:self.depth]
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                # Dropped while filling, e.g. its filter changed: the posts may be for the old config
+                logger.info(f"Discarding candidates filled for a replaced config of r/{config['subreddit_name']}")
+                return list(posts)
+            self._queues[key] = _CandidateQueue(config, posts)
+        logger.info(f"Queued {len(posts)} candidates for r/{config['subreddit_name']}")
+        return list(posts)
+
+    def _schedule_refill(self, config):
+        key = str(config['id'])
+        with self._lock:
+            if key in self._refilling:
+                return
+            self._refilling.add(key)
+        self._executor.submit(self._refill_in_background, config)
+
+    def _refill_in_background(self, config):
+        try:
+            self._refill(config)
+        except Exception as e:
+            logger.error(f"Error refilling candidates for r/{config['subreddit_name']}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refilling.discard(str(config['id']))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'configs': len(self._queues),
+                'candidates': sum(len(q.posts) for q in self._queues.values()),
+                'refilling': len(self._refilling)
+            }
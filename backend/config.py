@@ -12,15 +12,151 @@ class Config:
     # Reddit Configuration
     REDDIT_CLIENT_ID = os.environ.get('REDDIT_CLIENT_ID')
     REDDIT_CLIENT_SECRET = os.environ.get('REDDIT_CLIENT_SECRET')
+    # Service endpoints, overridable to point at local stand-ins (see benchmark.py)
+    REDDIT_URL = os.environ.get('REDDIT_URL', 'https://www.reddit.com')
+    REDDIT_OAUTH_URL = os.environ.get('REDDIT_OAUTH_URL', 'https://oauth.reddit.com')
 
     # Telegram Configuration
     TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
     TELEGRAM_CHANNEL_ID = os.environ.get('TELEGRAM_CHANNEL_ID')
+    TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org/bot')
+    TELEGRAM_POOL_SIZE = int(os.environ.get('TELEGRAM_POOL_SIZE', '8'))
+    TELEGRAM_SEND_TIMEOUT = int(os.environ.get('TELEGRAM_SEND_TIMEOUT', '300'))
 
     # Azure Cosmos DB Configuration
     COSMOS_ENDPOINT = os.environ.get('COSMOS_ENDPOINT')
     COSMOS_KEY = os.environ.get('COSMOS_KEY')
     COSMOS_DATABASE = os.environ.get('COSMOS_DATABASE')
+    # Log Cosmos calls (all pages and retries together) costing at least this many RU or taking this long
+    COSMOS_SLOW_REQUEST_UNITS = float(os.environ.get('COSMOS_SLOW_REQUEST_UNITS', '50'))
+    COSMOS_SLOW_REQUEST_MS = int(os.environ.get('COSMOS_SLOW_REQUEST_MS', '1000'))
+
+    # Storage backend: 'cosmos' or 'sqlite' (single node, no network round trips)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'cosmos')
+    SQLITE_PATH = os.environ.get('SQLITE_PATH', 'data/snoogram.db')
+
+    # Logging: level, 'text' or 'json' lines, rotating log file and optional console copy
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+    LOG_FILE = os.environ.get('LOG_FILE', 'app.log')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', '3'))
+    LOG_CONSOLE = os.environ.get('LOG_CONSOLE', 'false').lower() == 'true'
+    # Records buffered for the writer thread (dropped beyond that), per-call-site DEBUG/INFO
+    # records per minute (0 disables) and the floor for chatty third-party loggers
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+    LOG_RATE_LIMIT_PER_MINUTE = int(os.environ.get('LOG_RATE_LIMIT_PER_MINUTE', '60'))
+    LOG_LIBRARY_LEVEL = os.environ.get('LOG_LIBRARY_LEVEL', 'WARNING')
+
+    # Send pipeline: workers per stage and bounded queue size between stages
+    PIPELINE_FETCH_CONCURRENCY = int(os.environ.get('PIPELINE_FETCH_CONCURRENCY', '4'))
+    PIPELINE_DEDUP_CONCURRENCY = int(os.environ.get('PIPELINE_DEDUP_CONCURRENCY', '2'))
+    PIPELINE_RESOLVE_CONCURRENCY = int(os.environ.get('PIPELINE_RESOLVE_CONCURRENCY', '4'))
+    PIPELINE_DOWNLOAD_CONCURRENCY = int(os.environ.get('PIPELINE_DOWNLOAD_CONCURRENCY', '4'))
+    PIPELINE_UPLOAD_CONCURRENCY = int(os.environ.get('PIPELINE_UPLOAD_CONCURRENCY', '4'))
+    PIPELINE_RECORD_CONCURRENCY = int(os.environ.get('PIPELINE_RECORD_CONCURRENCY', '2'))
+    PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', '100'))
+    PIPELINE_LATE_WARNING_SECONDS = int(os.environ.get('PIPELINE_LATE_WARNING_SECONDS', '60'))
+
+    # Scheduler
+    SCHEDULER_MISFIRE_GRACE_SECONDS = int(os.environ.get('SCHEDULER_MISFIRE_GRACE_SECONDS', '300'))
+    # Random delay added to every run, and whether configs get a stable per-id phase within their interval
+    SCHEDULER_JITTER_SECONDS = int(os.environ.get('SCHEDULER_JITTER_SECONDS', '30'))
+    SCHEDULER_SPREAD_PHASES = os.environ.get('SCHEDULER_SPREAD_PHASES', 'true').lower() == 'true'
+
+    # Shared rate limits per external service (requests per second, burst); 0 disables
+    REDDIT_RATE_PER_SECOND = float(os.environ.get('REDDIT_RATE_PER_SECOND', '1.0'))
+    REDDIT_RATE_BURST = int(os.environ.get('REDDIT_RATE_BURST', '5'))
+    TELEGRAM_CHAT_RATE_PER_SECOND = float(os.environ.get('TELEGRAM_CHAT_RATE_PER_SECOND', '0.33'))
+    TELEGRAM_CHAT_RATE_BURST = int(os.environ.get('TELEGRAM_CHAT_RATE_BURST', '3'))
+    # Longest an upload worker waits for the chat budget (or flood control); past it the posts wait for the next tick
+    TELEGRAM_MAX_WAIT_SECONDS = float(os.environ.get('TELEGRAM_MAX_WAIT_SECONDS', '30'))
+    REDGIFS_RATE_PER_SECOND = float(os.environ.get('REDGIFS_RATE_PER_SECOND', '2.0'))
+    REDGIFS_RATE_BURST = int(os.environ.get('REDGIFS_RATE_BURST', '5'))
+    COSMOS_RATE_PER_SECOND = float(os.environ.get('COSMOS_RATE_PER_SECOND', '50'))
+    COSMOS_RATE_BURST = int(os.environ.get('COSMOS_RATE_BURST', '100'))
+
+    # Reddit listing cache TTLs (seconds) per filter type
+    LISTING_CACHE_TTL_TOP_DAY = int(os.environ.get('LISTING_CACHE_TTL_TOP_DAY', '300'))
+    LISTING_CACHE_TTL_TOP_WEEK = int(os.environ.get('LISTING_CACHE_TTL_TOP_WEEK', '1800'))
+    LISTING_CACHE_TTL_TOP_MONTH = int(os.environ.get('LISTING_CACHE_TTL_TOP_MONTH', '3600'))
+    LISTING_CACHE_TTL_TOP_YEAR = int(os.environ.get('LISTING_CACHE_TTL_TOP_YEAR', '21600'))
+
+    # Prefetch listings due soon into the listing cache, several per multireddit call.
+    # The lookahead should exceed PREFETCH_LEAD_SECONDS and stay under the listing TTLs.
+    REDDIT_BATCH_MODE = os.environ.get('REDDIT_BATCH_MODE', 'false').lower() == 'true'
+    REDDIT_BATCH_SCAN_SECONDS = int(os.environ.get('REDDIT_BATCH_SCAN_SECONDS', '30'))
+    REDDIT_BATCH_MAX_SUBREDDITS = int(os.environ.get('REDDIT_BATCH_MAX_SUBREDDITS', '25'))
+    REDDIT_BATCH_POSTS_PER_SUBREDDIT = int(os.environ.get('REDDIT_BATCH_POSTS_PER_SUBREDDIT', '20'))
+    REDDIT_BATCH_MIN_POSTS = int(os.environ.get('REDDIT_BATCH_MIN_POSTS', '10'))
+    REDDIT_BATCH_LOOKAHEAD_SECONDS = int(os.environ.get('REDDIT_BATCH_LOOKAHEAD_SECONDS', '180'))
+    REDDIT_BATCH_FALLBACK_WORKERS = int(os.environ.get('REDDIT_BATCH_FALLBACK_WORKERS', '4'))
+
+    # Precomputed per-config candidate queues; a depth of 0 keeps the whole listing
+    CANDIDATE_QUEUE_DEPTH = int(os.environ.get('CANDIDATE_QUEUE_DEPTH', '0'))
+    CANDIDATE_QUEUE_LOW_WATER = int(os.environ.get('CANDIDATE_QUEUE_LOW_WATER', '3'))
+    CANDIDATE_QUEUE_MAX_AGE_SECONDS = int(os.environ.get('CANDIDATE_QUEUE_MAX_AGE_SECONDS', '1800'))
+    CANDIDATE_REFILL_WORKERS = int(os.environ.get('CANDIDATE_REFILL_WORKERS', '2'))
+
+    # Media prefetch ahead of scheduled ticks
+    PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', 'true').lower() == 'true'
+    PREFETCH_LEAD_SECONDS = int(os.environ.get('PREFETCH_LEAD_SECONDS', '120'))
+    PREFETCH_SCAN_SECONDS = int(os.environ.get('PREFETCH_SCAN_SECONDS', '30'))
+    PREFETCH_CONCURRENCY = int(os.environ.get('PREFETCH_CONCURRENCY', '2'))
+    PREFETCH_MAX_BYTES_IN_FLIGHT = int(os.environ.get('PREFETCH_MAX_BYTES_IN_FLIGHT', str(200 * 1024 ** 2)))
+    # Counted against the in-flight cap for downloads without a Content-Length
+    PREFETCH_UNKNOWN_SIZE_BYTES = int(os.environ.get('PREFETCH_UNKNOWN_SIZE_BYTES', str(50 * 1024 ** 2)))
+
+    # Outbound HTTP (Redgifs, media CDNs)
+    HTTP_POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS', '20'))
+    HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '10'))
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5'))
+    HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '30'))
+    HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', '3'))
+    HTTP_BACKOFF_BASE = float(os.environ.get('HTTP_BACKOFF_BASE', '0.5'))
+    HTTP_BACKOFF_MAX = float(os.environ.get('HTTP_BACKOFF_MAX', '30'))
+
+    # Redgifs: API endpoint, temporary token lifetime, early refresh window and resolved URL cache
+    REDGIFS_API_URL = os.environ.get('REDGIFS_API_URL', 'https://api.redgifs.com/v2')
+    REDGIFS_TOKEN_TTL_SECONDS = int(os.environ.get('REDGIFS_TOKEN_TTL_SECONDS', '3600'))
+    REDGIFS_TOKEN_REFRESH_MARGIN_SECONDS = int(os.environ.get('REDGIFS_TOKEN_REFRESH_MARGIN_SECONDS', '300'))
+    REDGIFS_URL_CACHE_TTL_SECONDS = int(os.environ.get('REDGIFS_URL_CACHE_TTL_SECONDS', '3600'))
+
+    # Downloaded media cache
+    MEDIA_CACHE_DIR = os.environ.get('MEDIA_CACHE_DIR', 'downloads/cache')
+    MEDIA_CACHE_MAX_BYTES = int(os.environ.get('MEDIA_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+    MEDIA_CACHE_TTL_SECONDS = int(os.environ.get('MEDIA_CACHE_TTL_SECONDS', '0'))
+
+    # 'disk' downloads into the media cache; 'stream' relays through a spooled buffer
+    MEDIA_RELAY_MODE = os.environ.get('MEDIA_RELAY_MODE', 'disk')
+    MEDIA_SPOOL_MAX_BYTES = int(os.environ.get('MEDIA_SPOOL_MAX_BYTES', str(20 * 1024 ** 2)))
+    # Larger media goes through the disk path instead (Bot API uploads are capped at 50 MB anyway)
+    MEDIA_RELAY_MAX_BYTES = int(os.environ.get('MEDIA_RELAY_MAX_BYTES', str(50 * 1024 ** 2)))
+
+    # Media download backend: 'requests' or 'async' (httpx, parallel ranges, resumable)
+    DOWNLOAD_BACKEND = os.environ.get('DOWNLOAD_BACKEND', 'requests')
+    ASYNC_DOWNLOAD_CONCURRENCY = int(os.environ.get('ASYNC_DOWNLOAD_CONCURRENCY', '8'))
+    ASYNC_DOWNLOAD_SEGMENTS = int(os.environ.get('ASYNC_DOWNLOAD_SEGMENTS', '4'))
+    ASYNC_DOWNLOAD_SEGMENT_MIN_BYTES = int(os.environ.get('ASYNC_DOWNLOAD_SEGMENT_MIN_BYTES', str(4 * 1024 ** 2)))
+    ASYNC_DOWNLOAD_CHUNK_MIN_BYTES = int(os.environ.get('ASYNC_DOWNLOAD_CHUNK_MIN_BYTES', str(64 * 1024)))
+    ASYNC_DOWNLOAD_CHUNK_MAX_BYTES = int(os.environ.get('ASYNC_DOWNLOAD_CHUNK_MAX_BYTES', str(4 * 1024 ** 2)))
+
+    # Perceptual-hash media dedup (needs Pillow); max Hamming distance of a 64-bit dHash to count as a repost
+    PHASH_DEDUP_ENABLED = os.environ.get('PHASH_DEDUP_ENABLED', 'true').lower() == 'true'
+    PHASH_MAX_DISTANCE = int(os.environ.get('PHASH_MAX_DISTANCE', '6'))
+
+    # sent_posts retention in days (container TTL); never shorter than the top_year window. 0 keeps posts forever
+    SENT_POSTS_TTL_DAYS = int(os.environ.get('SENT_POSTS_TTL_DAYS', '400'))
+
+    # /api/sent_posts/recent: default and maximum posts per request, posts per Cosmos query
+    SENT_POSTS_DEFAULT_LIMIT = int(os.environ.get('SENT_POSTS_DEFAULT_LIMIT', '50'))
+    SENT_POSTS_MAX_LIMIT = int(os.environ.get('SENT_POSTS_MAX_LIMIT', '1000'))
+    SENT_POSTS_PAGE_SIZE = int(os.environ.get('SENT_POSTS_PAGE_SIZE', '100'))
+
+    # Sent-post dedup index ('set', 'bloom' or 'off')
+    DEDUP_INDEX_MODE = os.environ.get('DEDUP_INDEX_MODE', 'set')
+    DEDUP_BLOOM_CAPACITY = int(os.environ.get('DEDUP_BLOOM_CAPACITY', '1000000'))
+    DEDUP_BLOOM_ERROR_RATE = float(os.environ.get('DEDUP_BLOOM_ERROR_RATE', '0.001'))
 
     @classmethod
     def validate(cls):
@@ -43,3 +179,14 @@ class Config:
                 else:
                     print(f"{key}: {value}")
         print()
+
+# Telegram allows at most this many items in one album
+MEDIA_GROUP_MAX = 10
+
+def clamp_batch_size(value):
+    """Posts per tick, clamped to one Telegram album; ValueError if not a number"""
+    try:
+        size = int(value or 1)
+    except (TypeError, ValueError):
+        raise ValueError(f"batch_size must be a whole number, got {value!r}")
+    return min(max(size, 1), MEDIA_GROUP_MAX)
@@ -1,12 +1,17 @@
-from azure.cosmos import CosmosClient, PartitionKey
+from azure.cosmos import CosmosClient, PartitionKey, exceptions
+from azure.core import MatchConditions
 from datetime import datetime
 import logging
+import threading
 import traceback
 from functools import wraps
 from config import Config
+from rate_limit import cosmos_limiter
+from cosmos_stats import cosmos_request_stats
+# Re-exported: these lived here before the storage module
+from storage import ConcurrentModificationError, SENT_POSTS_MIN_TTL_DAYS, sent_posts_ttl_seconds
 import uuid
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def singleton(cls):
@@ -17,16 +22,66 @@ def singleton(cls):
         return _instances[cls]
     return get_instance
 
+# Only index what dedup, hash warm-up and the recent-posts API filter or sort on
+SENT_POSTS_INDEXING_POLICY = {
+    'indexingMode': 'consistent',
+    'automatic': True,
+    'includedPaths': [
+        {'path': '/post_id/?'},
+        {'path': '/subreddit_name/?'},
+        {'path': '/phash/?'},
+        {'path': '/_ts/?'}
+    ],
+    'excludedPaths': [
+        {'path': '/*'}
+    ],
+    'compositeIndexes': [
+        [
+            {'path': '/subreddit_name', 'order': 'ascending'},
+            {'path': '/_ts', 'order': 'descending'}
+        ]
+    ]
+}
+
+def _same_indexing_policy(current, wanted):
+    """Compare the parts of an indexing policy we set, ignoring the system _etag exclusion"""
+    def paths(policy, key):
+        return {p['path'] for p in policy.get(key, []) if p['path'] != '/"_etag"/?'}
+
+    def composites(policy):
+        return sorted(
+            [(p['path'], p.get('order', 'ascending')) for p in index]
+            for index in policy.get('compositeIndexes', [])
+        )
+
+    return (
+        paths(current, 'includedPaths') == paths(wanted, 'includedPaths')
+        and paths(current, 'excludedPaths') == paths(wanted, 'excludedPaths')
+        and composites(current) == composites(wanted)
+    )
+
 @singleton
 class CosmosDB:
     def __init__(self):
+        # id -> subreddit_name (partition key), so configs can be point-read by id
+        self._config_partitions = {}
+        self._config_partitions_lock = threading.Lock()
         self._initialize()
 
+    def _remember_config(self, config):
+        with self._config_partitions_lock:
+            self._config_partitions[str(config['id'])] = config['subreddit_name']
+
+    def _forget_config(self, config_id):
+        with self._config_partitions_lock:
+            self._config_partitions.pop(str(config_id), None)
+
     def _initialize(self):
         self.client = None
         self.database = None
         self.subreddit_config_container = None
         self.sent_posts_container = None
+        self.telegram_files_container = None
         self.is_initialized = False
 
         try:
@@ -42,7 +97,17 @@ class CosmosDB:
             if endpoint and key and database_name:
                 logger.info("\nInitializing Cosmos DB client...")
                 try:
-                    self.client = CosmosClient(url=endpoint, credential=key)
+                    # Every request, retries included, draws from the shared Cosmos budget
+                    # and has its request charge accounted to the calling operation. The
+                    # wait is unbounded on purpose: the calling thread (a Flask request,
+                    # a pipeline worker) stalls until its turn rather than dropping a
+                    # write such as a sent-post record
+                    self.client = CosmosClient(
+                        url=endpoint,
+                        credential=key,
+                        raw_request_hook=lambda request: cosmos_limiter.acquire(),
+                        raw_response_hook=cosmos_request_stats.record_response
+                    )
                     logger.info("Successfully created Cosmos DB client")
                 except Exception as e:
                     logger.error(f"Error creating Cosmos DB client: {str(e)}")
@@ -75,9 +140,12 @@ class CosmosDB:
                 
                 logger.info("Creating/getting sent_posts container...")
                 try:
+                    # Applies to new containers only; existing ones are moved over by apply_sent_posts_policy
                     self.sent_posts_container = self.database.create_container_if_not_exists(
                         id='sent_posts',
                         partition_key=PartitionKey(path='/subreddit_name'),
+                        indexing_policy=SENT_POSTS_INDEXING_POLICY,
+                        default_ttl=sent_posts_ttl_seconds(),
                         offer_throughput=400
                     )
                     logger.info("Successfully created sent_posts container")
@@ -85,6 +153,19 @@ class CosmosDB:
                     logger.error(f"Error creating sent_posts container: {str(e)}")
                     logger.error(traceback.format_exc())
                     return
+
+                logger.info("Creating/getting telegram_files container...")
+                try:
+                    self.telegram_files_container = self.database.create_container_if_not_exists(
+                        id='telegram_files',
+                        partition_key=PartitionKey(path='/id'),
+                        offer_throughput=400
+                    )
+                    logger.info("Successfully created telegram_files container")
+                except Exception as e:
+                    # Only needed for file_id reuse; sending still works without it
+                    logger.error(f"Error creating telegram_files container: {str(e)}")
+                    logger.error(traceback.format_exc())
                 
                 self.is_initialized = True
                 logger.info("Cosmos DB initialized successfully")
@@ -101,6 +182,7 @@ class CosmosDB:
             logger.error(f"Error initializing Cosmos DB: {str(e)}")
             logger.error(traceback.format_exc())
 
+    @cosmos_request_stats.tracked
     def create_subreddit_config(self, config_data):
         """Create a new subreddit configuration"""
         if not self.is_initialized:
@@ -118,12 +200,14 @@ class CosmosDB:
             logger.info(f"Creating subreddit config in Cosmos DB: {config_data}")
             result = self.subreddit_config_container.create_item(body=config_data)
             logger.info(f"Successfully created config in Cosmos DB: {result}")
+            self._remember_config(result)
             return result
         except Exception as e:
             logger.error(f"Error creating subreddit config in Cosmos DB: {str(e)}")
             logger.error(traceback.format_exc())
             return None
 
+    @cosmos_request_stats.tracked
     def get_subreddit_config(self, subreddit_name):
         """Get subreddit configuration by name"""
         if not self.is_initialized:
@@ -146,6 +230,7 @@ class CosmosDB:
             logger.error(traceback.format_exc())
             return None
 
+    @cosmos_request_stats.tracked
     def get_all_subreddit_configs(self):
         """Get all subreddit configurations"""
         if not self.is_initialized:
@@ -162,12 +247,82 @@ class CosmosDB:
                 enable_cross_partition_query=True
             ))
             logger.info(f"Found {len(results)} configs in Cosmos DB")
+            for config in results:
+                self._remember_config(config)
             return results
         except Exception as e:
             logger.error(f"Error getting all subreddit configs from Cosmos DB: {str(e)}")
             logger.error(traceback.format_exc())
             return []
 
+    @cosmos_request_stats.tracked
+    def get_subreddit_config_by_id(self, config_id):
+        """Get subreddit configuration by id with a point read when its partition is known"""
+        if not self.is_initialized:
+            self._initialize()
+            if not self.is_initialized:
+                logger.error("Cosmos DB not initialized, skipping get_subreddit_config_by_id")
+                return None
+
+        config_id = str(config_id)
+        try:
+            subreddit_name = self._config_partitions.get(config_id)
+            if subreddit_name is not None:
+                try:
+                    return self.subreddit_config_container.read_item(
+                        item=config_id,
+                        partition_key=subreddit_name
+                    )
+                except exceptions.CosmosResourceNotFoundError:
+                    self._forget_config(config_id)
+                    return None
+
+            # Unknown id: one indexed lookup, then point reads from here on
+            query = "SELECT * FROM c WHERE c.id = @id"
+            params = [{"name": "@id", "value": config_id}]
+            results = list(self.subreddit_config_container.query_items(
+                query=query,
+                parameters=params,
+                enable_cross_partition_query=True
+            ))
+            if not results:
+                return None
+            self._remember_config(results[0])
+            return results[0]
+        except Exception as e:
+            logger.error(f"Error getting subreddit config {config_id} from Cosmos DB: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    @cosmos_request_stats.tracked
+    def replace_subreddit_config(self, config_data):
+        """Replace a subreddit configuration read earlier, only if it has not changed since.
+
+        Raises ConcurrentModificationError when the stored ETag no longer matches.
+        """
+        if not self.is_initialized:
+            self._initialize()
+            if not self.is_initialized:
+                logger.error("Cosmos DB not initialized, skipping replace_subreddit_config")
+                return None
+
+        try:
+            config_data['id'] = str(config_data['id'])
+            return self.subreddit_config_container.replace_item(
+                item=config_data['id'],
+                body=config_data,
+                etag=config_data.get('_etag'),
+                match_condition=MatchConditions.IfNotModified
+            )
+        except exceptions.CosmosAccessConditionFailedError:
+            logger.warning(f"Subreddit config {config_data['id']} was modified concurrently")
+            raise ConcurrentModificationError(config_data['id'])
+        except Exception as e:
+            logger.error(f"Error replacing subreddit config in Cosmos DB: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    @cosmos_request_stats.tracked
     def update_subreddit_config(self, config_data):
         """Update an existing subreddit configuration"""
         if not self.is_initialized:
@@ -184,6 +339,7 @@ class CosmosDB:
             logger.error(traceback.format_exc())
             return None
 
+    @cosmos_request_stats.tracked
     def delete_subreddit_config(self, config_id, subreddit_name):
         """Delete a subreddit configuration"""
         if not self.is_initialized:
@@ -197,10 +353,12 @@ class CosmosDB:
                 item=str(config_id),
                 partition_key=subreddit_name
             )
+            self._forget_config(config_id)
         except Exception as e:
             logger.error(f"Error deleting subreddit config from Cosmos DB: {str(e)}")
             logger.error(traceback.format_exc())
 
+    @cosmos_request_stats.tracked
     def create_sent_post(self, post_data):
         """Record a sent post"""
         if not self.is_initialized:
@@ -221,6 +379,7 @@ class CosmosDB:
             logger.error(traceback.format_exc())
             return None
 
+    @cosmos_request_stats.tracked
     def is_duplicate_post(self, post_id):
         """Check if a post has been sent before"""
         if not self.is_initialized:
@@ -243,5 +402,205 @@ class CosmosDB:
             logger.error(traceback.format_exc())
             return False
 
+    @cosmos_request_stats.tracked
+    def find_sent_post_ids(self, post_ids, subreddit_name):
+        """Return the subset of post_ids already sent for a subreddit, in one single-partition query"""
+        if not self.is_initialized:
+            self._initialize()
+            if not self.is_initialized:
+                logger.error("Cosmos DB not initialized, skipping find_sent_post_ids")
+                return set()
+
+        post_ids = list(post_ids)
+        if not post_ids:
+            return set()
+
+        try:
+            query = "SELECT VALUE c.post_id FROM c WHERE ARRAY_CONTAINS(@post_ids, c.post_id)"
+            params = [{"name": "@post_ids", "value": post_ids}]
+            results = self.sent_posts_container.query_items(
+                query=query,
+                parameters=params,
+                partition_key=subreddit_name
+            )
+            return set(results)
+        except Exception as e:
+            logger.error(f"Error finding sent posts in Cosmos DB: {str(e)}")
+            logger.error(traceback.format_exc())
+            return set()
+
+    @cosmos_request_stats.tracked
+    def get_all_sent_post_ids(self):
+        """Get the post ids of every sent post, or None if they could not be loaded"""
+        if not self.is_initialized:
+            self._initialize()
+            if not self.is_initialized:
+                logger.error("Cosmos DB not initialized, skipping get_all_sent_post_ids")
+                return None
+
+        try:
+            query = "SELECT VALUE c.post_id FROM c"
+            logger.info("Querying all sent post ids from Cosmos DB...")
+            results = list(self.sent_posts_container.query_items(
+                query=query,
+                enable_cross_partition_query=True
+            ))
+            logger.info(f"Found {len(results)} sent posts in Cosmos DB")
+            return results
+        except Exception as e:
+            logger.error(f"Error getting sent post ids from Cosmos DB: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    @cosmos_request_stats.tracked
+    def get_sent_posts_page(self, limit, since_ts=None, before_ts=None, exclude_ids=None, subreddit_name=None):
+        """Get up to `limit` sent posts, newest first, with only the fields the API returns.
+
+        before_ts/exclude_ids continue after a previous page: posts at or
+        before that timestamp, minus the ones already returned at it.
+        Returns None on error.
+        """
+        if not self.is_initialized:
+            self._initialize()
+            if not self.is_initialized:
+                logger.error("Cosmos DB not initialized, skipping get_sent_posts_page")
+                return None
+
+        try:
+            conditions = []
+            params = [{"name": "@limit", "value": int(limit)}]
+            if since_ts is not None:
+                conditions.append("c._ts >= @since")
+                params.append({"name": "@since", "value": int(since_ts)})
+            if before_ts is not None:
+                conditions.append("c._ts <= @before")
+                params.append({"name": "@before", "value": int(before_ts)})
+            if exclude_ids:
+                conditions.append("NOT ARRAY_CONTAINS(@exclude, c.id)")
+                params.append({"name": "@exclude", "value": list(exclude_ids)})
+            if subreddit_name:
+                conditions.append("c.subreddit_name = @subreddit_name")
+                params.append({"name": "@subreddit_name", "value": subreddit_name})
+
+            query = (
+                "SELECT TOP @limit c.id, c.post_id, c.subreddit_name, c.sent_at, c.duplicate_of, c._ts FROM c"
+                + (" WHERE " + " AND ".join(conditions) if conditions else "")
+                # Led by the partition key so the (subreddit_name, _ts DESC) composite index serves it
+                + (" ORDER BY c.subreddit_name ASC, c._ts DESC" if subreddit_name else " ORDER BY c._ts DESC")
+            )
+            options = {'partition_key': subreddit_name} if subreddit_name else {'enable_cross_partition_query': True}
+            return list(self.sent_posts_container.query_items(
+                query=query,
+                parameters=params,
+                max_item_count=int(limit),
+                **options
+            ))
+        except Exception as e:
+            logger.error(f"Error getting sent posts page from Cosmos DB: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    @cosmos_request_stats.tracked
+    def get_sent_post_phashes(self):
+        """Get (post_id, phash) of every sent post with a perceptual hash, or None on error"""
+        if not self.is_initialized:
+            self._initialize()
+            if not self.is_initialized:
+                logger.error("Cosmos DB not initialized, skipping get_sent_post_phashes")
+                return None
+
+        try:
+            query = "SELECT c.post_id, c.phash FROM c WHERE IS_DEFINED(c.phash) AND NOT IS_NULL(c.phash)"
+            results = list(self.sent_posts_container.query_items(
+                query=query,
+                enable_cross_partition_query=True
+            ))
+            logger.info(f"Found {len(results)} sent post hashes in Cosmos DB")
+            return [(item['post_id'], item['phash']) for item in results]
+        except Exception as e:
+            logger.error(f"Error getting sent post hashes from Cosmos DB: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    @cosmos_request_stats.tracked
+    def apply_sent_posts_policy(self):
+        """Bring an existing sent_posts container to the configured TTL and indexing policy.
+
+        Cosmos rebuilds the index online after the change; writes and queries
+        keep working meanwhile. Lowering the TTL deletes posts older than it.
+        Returns True if the container was changed, False if it was already
+        current, None on error.
+        """
+        if not self.is_initialized:
+            self._initialize()
+            if not self.is_initialized:
+                logger.error("Cosmos DB not initialized, skipping apply_sent_posts_policy")
+                return None
+
+        try:
+            properties = self.sent_posts_container.read()
+            ttl = sent_posts_ttl_seconds()
+            if properties.get('defaultTtl') == ttl and _same_indexing_policy(properties.get('indexingPolicy', {}), SENT_POSTS_INDEXING_POLICY):
+                logger.info("sent_posts container already has the current TTL and indexing policy")
+                return False
+
+            logger.info(f"Updating sent_posts container: default TTL {properties.get('defaultTtl')} -> {ttl}, applying indexing policy")
+            self.sent_posts_container = self.database.replace_container(
+                self.sent_posts_container,
+                partition_key=PartitionKey(path='/subreddit_name'),
+                indexing_policy=SENT_POSTS_INDEXING_POLICY,
+                default_ttl=ttl
+            )
+            logger.info("Successfully updated sent_posts container, index transformation runs in the background")
+            return True
+        except Exception as e:
+            logger.error(f"Error updating sent_posts container policy: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    @cosmos_request_stats.tracked
+    def get_telegram_file_id(self, media_hash):
+        """Get the Telegram file_id recorded for a media content hash"""
+        if not self.is_initialized:
+            self._initialize()
+            if not self.is_initialized:
+                logger.error("Cosmos DB not initialized, skipping get_telegram_file_id")
+                return None
+        if self.telegram_files_container is None:
+            return None
+
+        try:
+            item = self.telegram_files_container.read_item(item=media_hash, partition_key=media_hash)
+            return item.get('file_id')
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error getting Telegram file_id from Cosmos DB: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    @cosmos_request_stats.tracked
+    def save_telegram_file_id(self, media_hash, file_id, media_type):
+        """Record the Telegram file_id for a media content hash"""
+        if not self.is_initialized:
+            self._initialize()
+            if not self.is_initialized:
+                logger.error("Cosmos DB not initialized, skipping save_telegram_file_id")
+                return None
+        if self.telegram_files_container is None:
+            return None
+
+        try:
+            return self.telegram_files_container.upsert_item(body={
+                'id': media_hash,
+                'file_id': file_id,
+                'media_type': media_type,
+                'created_at': datetime.utcnow().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"Error saving Telegram file_id in Cosmos DB: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
 # Create a singleton instance
 cosmos_db = CosmosDB()
@@ -0,0 +1,193 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from config import Config
+from metrics import cosmos_request_units_total, cosmos_throttled_requests_total
+
+logger = logging.getLogger(__name__)
+
+# Responses that are part of normal operation rather than failures
+EXPECTED_STATUSES = {404, 409, 412, 429}
+UNTRACKED = '(untracked)'
+
+def _new_call():
+    return {'charge': 0.0, 'requests': 0, 'throttled': 0, 'errors': 0, 'cross_partition': False, 'query': None}
+
+class _OperationStats:
+    def __init__(self, latency_window):
+        self.calls = 0
+        self.requests = 0
+        self.request_charge = 0.0
+        self.max_charge = 0.0
+        self.throttled = 0
+        self.errors = 0
+        self.cross_partition_calls = 0
+        self.slow_calls = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latencies = deque(maxlen=latency_window)
+
+    def to_dict(self):
+        latencies = sorted(self.latencies)
+        return {
+            'calls': self.calls,
+            'requests': self.requests,
+            'request_charge': round(self.request_charge, 2),
+            'avg_charge': round(self.request_charge / self.calls, 2) if self.calls else 0.0,
+            'max_charge': round(self.max_charge, 2),
+            'throttled': self.throttled,
+            'errors': self.errors,
+            'cross_partition_calls': self.cross_partition_calls,
+            'slow_calls': self.slow_calls,
+            'avg_latency_ms': round(self.latency_total / self.calls * 1000, 1) if self.calls else 0.0,
+            'p95_latency_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else 0.0,
+            'max_latency_ms': round(self.latency_max * 1000, 1)
+        }
+
+class RequestChargeTracker:
+    """Request units, latency and throttling of Cosmos calls, aggregated per operation.
+
+    Storage methods run inside track(operation); the client's
+    raw_response_hook (record_response) sees every HTTP response of the
+    call, each query page and 429 retry included, and attributes it to that
+    operation through a thread-local. Calls over the RU or latency threshold
+    are logged with their query text.
+    """
+
+    def __init__(self, slow_request_units, slow_ms, latency_window=500):
+        self.slow_request_units = slow_request_units
+        self.slow_ms = slow_ms
+        self._latency_window = latency_window
+        self._operations = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_at = time.time()
+
+    @contextmanager
+    def track(self, operation):
+        call = _new_call()
+        previous = getattr(self._local, 'call', None)
+        self._local.call = call
+        started = time.perf_counter()
+        try:
+            yield call
+        except Exception:
+            call['errors'] += 1
+            raise
+        finally:
+            self._local.call = previous
+            self._finish(operation, call, time.perf_counter() - started)
+
+    def tracked(self, method):
+        """Decorator tracking a storage method under its own name"""
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            with self.track(method.__name__):
+                return method(*args, **kwargs)
+        return wrapper
+
+    def record_response(self, pipeline_response):
+        """raw_response_hook for the Cosmos client"""
+        try:
+            request = pipeline_response.http_request
+            response = pipeline_response.http_response
+            charge = float(response.headers.get('x-ms-request-charge') or 0)
+            status = response.status_code
+            cross_partition = request.headers.get('x-ms-documentdb-query-enablecrosspartition', '').lower() == 'true'
+        except Exception as e:
+            logger.debug(f"Could not read Cosmos response headers: {str(e)}")
+            return
+
+        call = getattr(self._local, 'call', None)
+        if call is None:
+            # Database/container setup and anything else outside a tracked method
+            call = _new_call()
+            self._record_response(call, charge, status, cross_partition, request)
+            self._finish(UNTRACKED, call, None)
+            return
+        self._record_response(call, charge, status, cross_partition, request)
+
+    @staticmethod
+    def _record_response(call, charge, status, cross_partition, request):
+        call['charge'] += charge
+        call['requests'] += 1
+        if status == 429:
+            call['throttled'] += 1
+        elif status >= 400 and status not in EXPECTED_STATUSES:
+            call['errors'] += 1
+        call['cross_partition'] = call['cross_partition'] or cross_partition
+        if call['query'] is None and request.headers.get('x-ms-documentdb-isquery', '').lower() == 'true':
+            call['query'] = _query_text(request)
+
+    def _finish(self, operation, call, latency):
+        with self._lock:
+            stats = self._operations.get(operation)
+            if stats is None:
+                stats = self._operations[operation] = _OperationStats(self._latency_window)
+            stats.calls += 1
+            stats.requests += call['requests']
+            stats.request_charge += call['charge']
+            stats.max_charge = max(stats.max_charge, call['charge'])
+            stats.throttled += call['throttled']
+            stats.errors += call['errors']
+            stats.cross_partition_calls += call['cross_partition']
+            if latency is not None:
+                stats.latency_total += latency
+                stats.latency_max = max(stats.latency_max, latency)
+                stats.latencies.append(latency)
+            slow = latency is not None and (
+                call['charge'] >= self.slow_request_units or latency * 1000 >= self.slow_ms
+            )
+            stats.slow_calls += slow
+
+        cosmos_request_units_total.inc(call['charge'], operation=operation)
+        if call['throttled']:
+            cosmos_throttled_requests_total.inc(call['throttled'], operation=operation)
+        if slow:
+            logger.warning(
+                f"Slow Cosmos call {operation}: {call['charge']:.1f} RU over {call['requests']} requests "
+                f"in {latency * 1000:.0f}ms, {call['throttled']} throttled"
+                f"{', cross-partition' if call['cross_partition'] else ''}"
+                f"{', query: ' + call['query'] if call['query'] else ''}"
+            )
+
+    def snapshot(self):
+        with self._lock:
+            operations = {name: stats.to_dict() for name, stats in sorted(self._operations.items())}
+        elapsed = max(time.time() - self._started_at, 1e-9)
+        total_charge = sum(stats['request_charge'] for stats in operations.values())
+        return {
+            'since': datetime.fromtimestamp(self._started_at).isoformat(),
+            'request_charge': round(total_charge, 2),
+            'request_units_per_second': round(total_charge / elapsed, 3),
+            'throttled': sum(stats['throttled'] for stats in operations.values()),
+            'thresholds': {'request_units': self.slow_request_units, 'latency_ms': self.slow_ms},
+            'operations': operations
+        }
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}
+            self._started_at = time.time()
+
+def _query_text(request, limit=300):
+    """The SQL of a query request, shortened for logging"""
+    try:
+        body = request.body
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        query = json.loads(body).get('query', '') if body else ''
+    except (TypeError, ValueError, AttributeError):
+        return None
+    return query if len(query) <= limit else query[:limit] + '...'
+
+# Create a singleton instance
+cosmos_request_stats = RequestChargeTracker(
+    slow_request_units=Config.COSMOS_SLOW_REQUEST_UNITS,
+    slow_ms=Config.COSMOS_SLOW_REQUEST_MS
+)
@@ -1,65 +1,173 @@
-from cosmos_db import cosmos_db
+from storage import get_storage, ConcurrentModificationError
+from dedup_index import sent_post_index
+from perceptual_hash import media_hash_index, format_phash
 from datetime import datetime
+from metrics import db_write_seconds
+from config import clamp_batch_size
+
+# Cosmos DB or SQLite, per Config.STORAGE_BACKEND
+db = get_storage()
+
+CONFIG_UPDATE_ATTEMPTS = 3
 
 class DatabaseOperations:
     @staticmethod
     def add_subreddit_config(data):
-        cosmos_data = {
+        config_data = {
             'subreddit_name': data['subreddit_name'],
             'filter_type': data['filter_type'],
-            'frequency': data['frequency']
+            'frequency': data['frequency'],
+            'batch_size': clamp_batch_size(data.get('batch_size'))
         }
-        return cosmos_db.create_subreddit_config(cosmos_data)
+        with db_write_seconds.time(operation='create_config'):
+            return db.create_subreddit_config(config_data)
 
     @staticmethod
     def get_all_configs():
-        return cosmos_db.get_all_subreddit_configs()
+        return db.get_all_subreddit_configs()
+
+    @staticmethod
+    def get_config(config_id):
+        return db.get_subreddit_config_by_id(config_id)
+
+    @staticmethod
+    def _modify_config(config_id, change):
+        # Read-modify-write guarded by the item's ETag; re-read and retry on conflict
+        for _ in range(CONFIG_UPDATE_ATTEMPTS):
+            config = db.get_subreddit_config_by_id(config_id)
+            if not config:
+                raise Exception('Config not found')
+            change(config)
+            try:
+                with db_write_seconds.time(operation='replace_config'):
+                    return db.replace_subreddit_config(config)
+            except ConcurrentModificationError:
+                continue
+        raise Exception('Config was modified concurrently, please retry')
 
     @staticmethod
     def update_config(config_id, data):
-        # First get existing config to preserve other fields
-        configs = cosmos_db.get_all_subreddit_configs()
-        config = next((c for c in configs if c['id'] == str(config_id)), None)
-        if not config:
-            raise Exception('Config not found')
+        def change(config):
+            config['filter_type'] = data['filter_type']
+            config['frequency'] = data['frequency']
+            if 'batch_size' in data:
+                config['batch_size'] = clamp_batch_size(data['batch_size'])
+
+        return DatabaseOperations._modify_config(config_id, change)
+
+    @staticmethod
+    def update_last_check(config_id):
+        # Only last_check, so a tick never writes back settings a PUT changed meanwhile
+        def change(config):
+            config['last_check'] = datetime.now().isoformat()
 
-        # Update with new data
-        config['filter_type'] = data['filter_type']
-        config['frequency'] = data['frequency']
-        
-        return cosmos_db.update_subreddit_config(config)
+        return DatabaseOperations._modify_config(config_id, change)
 
     @staticmethod
     def delete_config(config_id):
-        # First get the config to get the subreddit_name for partition key
-        configs = cosmos_db.get_all_subreddit_configs()
-        config = next((c for c in configs if c['id'] == str(config_id)), None)
+        # Point read gives us the subreddit_name for the partition key
+        config = db.get_subreddit_config_by_id(config_id)
         if not config:
             raise Exception('Config not found')
             
-        cosmos_db.delete_subreddit_config(str(config_id), config['subreddit_name'])
+        with db_write_seconds.time(operation='delete_config'):
+            db.delete_subreddit_config(str(config_id), config['subreddit_name'])
 
     @staticmethod
     def toggle_config(config_id):
-        # First get existing config
-        configs = cosmos_db.get_all_subreddit_configs()
-        config = next((c for c in configs if c['id'] == str(config_id)), None)
-        if not config:
-            raise Exception('Config not found')
+        def change(config):
+            config['is_active'] = not config['is_active']
 
-        # Toggle is_active
-        config['is_active'] = not config['is_active']
-        
-        return cosmos_db.update_subreddit_config(config)
+        return DatabaseOperations._modify_config(config_id, change)
 
     @staticmethod
-    def add_sent_post(post_id, subreddit_name):
-        cosmos_data = {
+    def add_sent_post(post_id, subreddit_name, phash=None, duplicate_of=None):
+        # Lowercased, so configs of one subreddit saved as "Pics" and "pics" share a partition
+        post_data = {
             'post_id': post_id,
-            'subreddit_name': subreddit_name
+            'subreddit_name': subreddit_name.lower()
         }
-        return cosmos_db.create_sent_post(cosmos_data)
+        if phash is not None:
+            post_data['phash'] = format_phash(phash)
+        if duplicate_of:
+            # Skipped as a repost of an earlier post, never actually sent
+            post_data['duplicate_of'] = duplicate_of
+        with db_write_seconds.time(operation='create_sent_post'):
+            result = db.create_sent_post(post_data)
+        if result:
+            sent_post_index.add(post_id)
+            if not duplicate_of:
+                media_hash_index.add(phash, post_id)
+        return result
+
+    @staticmethod
+    def warm_dedup_index():
+        if sent_post_index.enabled:
+            sent_post_index.warm(db.get_all_sent_post_ids())
+        if media_hash_index.enabled:
+            media_hash_index.warm(db.get_sent_post_phashes())
 
     @staticmethod
     def is_duplicate_post(post_id):
-        return cosmos_db.is_duplicate_post(post_id)
+        # Misses are definitive once the index is warm; only unconfirmed hits go to Cosmos
+        known = sent_post_index.contains(post_id)
+        if known is False:
+            return False
+        if known and sent_post_index.is_exact:
+            return True
+        return db.is_duplicate_post(post_id)
+
+    @staticmethod
+    def find_sent_post_ids(post_ids, subreddit_name):
+        """Return which of post_ids were already sent, using at most one Cosmos query"""
+        unconfirmed = []
+        sent = set()
+        for post_id in post_ids:
+            known = sent_post_index.contains(post_id)
+            if known is None or (known and not sent_post_index.is_exact):
+                unconfirmed.append(post_id)
+            elif known:
+                sent.add(post_id)
+        if unconfirmed:
+            sent |= db.find_sent_post_ids(unconfirmed, subreddit_name.lower())
+        if unconfirmed and subreddit_name != subreddit_name.lower():
+            # Posts sent before names were lowercased sit under the config's spelling until their TTL
+            sent |= db.find_sent_post_ids([post_id for post_id in unconfirmed if post_id not in sent], subreddit_name)
+        return sent
+
+    @staticmethod
+    def get_recent_sent_posts(limit, since_ts=None, subreddit_name=None, cursor=None):
+        """One page of sent posts, newest first.
+
+        cursor is (last _ts, ids already returned at that _ts) from the
+        previous page. Returns (posts, next cursor or None), or (None, cursor)
+        on error.
+        """
+        before_ts, seen_ids = cursor if cursor else (None, [])
+        posts = db.get_sent_posts_page(
+            limit,
+            since_ts=since_ts,
+            before_ts=before_ts,
+            exclude_ids=seen_ids,
+            subreddit_name=subreddit_name.lower() if subreddit_name else None
+        )
+        if posts is None:
+            return None, cursor
+        if len(posts) < limit:
+            return posts, None
+
+        last_ts = posts[-1]['_ts']
+        # Keep skipping posts that share the boundary timestamp with ones already returned
+        ids = [post['id'] for post in posts if post['_ts'] == last_ts]
+        if last_ts == before_ts:
+            ids = list(seen_ids) + ids
+        return posts, (last_ts, ids)
+
+    @staticmethod
+    def get_telegram_file_id(media_hash):
+        return db.get_telegram_file_id(media_hash)
+
+    @staticmethod
+    def save_telegram_file_id(media_hash, file_id, media_type):
+        with db_write_seconds.time(operation='save_telegram_file_id'):
+            return db.save_telegram_file_id(media_hash, file_id, media_type)
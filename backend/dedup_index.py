@@ -0,0 +1,96 @@
+import hashlib
+import logging
+import math
+import threading
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class BloomFilter:
+    """Compact probabilistic set of post ids.
+
+    A miss is definitive; a hit may be a false positive and has to be
+    confirmed against the database.
+    """
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(int(capacity), 1)
+        self.num_bits = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+class SentPostIndex:
+    """Process-local index of post ids that have already been sent.
+
+    Modes (Config.DEDUP_INDEX_MODE):
+      - 'set':   exact in-memory set, answers every lookup locally
+      - 'bloom': Bloom filter, negatives answered locally, positives confirmed in Cosmos
+      - 'off':   disabled, every lookup goes to Cosmos
+    """
+
+    def __init__(self, mode=None):
+        self.mode = (mode or Config.DEDUP_INDEX_MODE).lower()
+        self.is_warm = False
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        if self.mode == 'bloom':
+            self._ids = BloomFilter(Config.DEDUP_BLOOM_CAPACITY, Config.DEDUP_BLOOM_ERROR_RATE)
+        else:
+            self._ids = set()
+
+    @property
+    def enabled(self):
+        return self.mode in ('set', 'bloom')
+
+    @property
+    def is_exact(self):
+        return self.mode == 'set'
+
+    def warm(self, post_ids):
+        """Load the index from the full list of sent post ids"""
+        if not self.enabled:
+            return
+        if post_ids is None:
+            logger.warning("Sent post ids unavailable, dedup index left cold")
+            return
+        with self._lock:
+            self._reset()
+            count = 0
+            for post_id in post_ids:
+                self._ids.add(post_id)
+                count += 1
+            self.is_warm = True
+        logger.info(f"Warmed {self.mode} dedup index with {count} sent posts")
+
+    def add(self, post_id):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._ids.add(post_id)
+
+    def contains(self, post_id):
+        """Return True/False when the index can answer, None when it is cold or disabled.
+
+        In bloom mode a True answer only means "maybe sent".
+        """
+        if not self.enabled or not self.is_warm:
+            return None
+        return post_id in self._ids
+
+# Create a singleton instance
+sent_post_index = SentPostIndex()
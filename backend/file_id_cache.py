@@ -0,0 +1,43 @@
+import logging
+import threading
+from db_operations import DatabaseOperations
+
+logger = logging.getLogger(__name__)
+
+class TelegramFileIdCache:
+    """Media content hash -> Telegram file_id, kept in memory in front of Cosmos.
+
+    Telegram accepts a file_id it returned earlier in place of the file
+    itself, so known media can be re-sent without uploading the bytes again.
+    """
+
+    def __init__(self):
+        self._file_ids = {}
+        self._lock = threading.Lock()
+
+    def get(self, media_hash):
+        if not media_hash:
+            return None
+        with self._lock:
+            file_id = self._file_ids.get(media_hash)
+        if file_id:
+            return file_id
+
+        file_id = DatabaseOperations.get_telegram_file_id(media_hash)
+        if file_id:
+            with self._lock:
+                self._file_ids[media_hash] = file_id
+        return file_id
+
+    def put(self, media_hash, file_id, media_type):
+        if not media_hash or not file_id:
+            return
+        with self._lock:
+            if self._file_ids.get(media_hash) == file_id:
+                return
+            self._file_ids[media_hash] = file_id
+        DatabaseOperations.save_telegram_file_id(media_hash, file_id, media_type)
+        logger.info(f"Recorded Telegram file_id for {media_type} {media_hash}")
+
+# Create a singleton instance
+telegram_file_ids = TelegramFileIdCache()
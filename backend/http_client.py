@@ -0,0 +1,86 @@
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class HttpClient:
+    """Shared requests session for all outbound HTTP calls.
+
+    Connections are pooled and kept alive per host, every request gets a
+    connect/read timeout, and connection errors, timeouts and retryable
+    statuses are retried with jittered exponential backoff. A Retry-After
+    header takes precedence over the computed backoff.
+    """
+
+    def __init__(self, pool_hosts, pool_size, connect_timeout, read_timeout,
+                 max_retries, backoff_base, backoff_max):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['User-Agent'] = 'RedditTelegramBot/1.0'
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"{method} {url} failed ({str(e)}), retrying in {delay:.1f}s")
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    return response
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                response.close()
+                logger.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def _backoff(self, attempt):
+        # Full jitter keeps concurrent retries from landing in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _retry_after(self, response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                return None
+        return min(max(delay, 0.0), self.backoff_max)
+
+# Create a singleton instance
+http_client = HttpClient(
+    pool_hosts=Config.HTTP_POOL_HOSTS,
+    pool_size=Config.HTTP_POOL_SIZE,
+    connect_timeout=Config.HTTP_CONNECT_TIMEOUT,
+    read_timeout=Config.HTTP_READ_TIMEOUT,
+    max_retries=Config.HTTP_MAX_RETRIES,
+    backoff_base=Config.HTTP_BACKOFF_BASE,
+    backoff_max=Config.HTTP_BACKOFF_MAX
+)
@@ -0,0 +1,79 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class ListingBatcher:
+    """Fetches soon-due listings ahead of time, several per multireddit call.
+
+    `prefetch()` runs from a scheduler job. For each filter type it takes
+    the subreddits whose ticks are due shortly and not yet cached (from
+    `due_soon`), fetches them together as reddit.subreddit("a+b+c").top(...)
+    in groups of up to max_subreddits, splits the result back out by
+    post.subreddit and hands every listing to `on_listing`. Members that
+    come back with too few posts, which happens to small subreddits next to
+    big ones, are fetched on their own, in parallel. Ticks never wait on a
+    batch: they read the listing cache and fetch a missing listing directly.
+    """
+
+    def __init__(self, fetch_combined, fetch_single, filter_types, due_soon, on_listing,
+                 max_subreddits, min_posts, workers):
+        self._fetch_combined = fetch_combined
+        self._fetch_single = fetch_single
+        self.filter_types = list(filter_types)
+        self._due_soon = due_soon
+        self._on_listing = on_listing
+        self.max_subreddits = max_subreddits
+        self.min_posts = min_posts
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='listing-fallback')
+        self.combined_fetches = 0
+        self.single_fetches = 0
+
+    def prefetch(self):
+        """Fetch and cache the listings of every subreddit due within the lookahead"""
+        for filter_type in self.filter_types:
+            try:
+                names = self._due_soon(filter_type)
+            except Exception as e:
+                logger.error(f"Error collecting due subreddits for {filter_type}: {str(e)}")
+                continue
+            self.fetch_listings(filter_type, names)
+
+    def fetch_listings(self, filter_type, subreddit_names):
+        """Fetch and cache these subreddits' listings in as few combined calls as possible"""
+        names = list(dict.fromkeys(name.lower() for name in subreddit_names))
+        for start in range(0, len(names), self.max_subreddits):
+            self._fetch_group(filter_type, names[start:start + self.max_subreddits])
+
+    def _fetch_group(self, filter_type, names):
+        listings = {}
+        if len(names) > 1:
+            try:
+                logger.info(f"Fetching {filter_type} listing for {len(names)} subreddits in one call")
+                listings = self._fetch_combined(names, filter_type)
+                self.combined_fetches += 1
+            except Exception as e:
+                logger.error(f"Combined listing fetch failed, falling back to single fetches: {str(e)}")
+
+        thin = []
+        for name in names:
+            posts = listings.get(name)
+            if posts is None or len(posts) < self.min_posts:
+                thin.append(name)
+            else:
+                self._on_listing(name, filter_type, posts)
+
+        futures = {name: self._executor.submit(self._fetch_single, name, filter_type) for name in thin}
+        for name, future in futures.items():
+            try:
+                self._on_listing(name, filter_type, future.result())
+                self.single_fetches += 1
+            except Exception as e:
+                # The tick fetches it itself when it comes due
+                logger.error(f"Error prefetching listing for r/{name}: {str(e)}")
+
+    def stats(self):
+        return {
+            'combined_fetches': self.combined_fetches,
+            'single_fetches': self.single_fetches
+        }
@@ -0,0 +1,87 @@
+import logging
+import threading
+from concurrent.futures import Future
+from config import Config
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class ListingCache:
+    """Reddit listings cached by (subreddit, filter_type).
+
+    Each filter type has its own TTL, since a top-of-year listing changes
+    far more slowly than a top-of-day one. Concurrent requests for the same
+    key share a single fetch.
+    """
+
+    def __init__(self, fetch, ttls, default_ttl=300, maxsize=4096):
+        self._fetch = fetch
+        self._ttls = ttls
+        self._listings = TTLCache(default_ttl, maxsize=maxsize)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(subreddit_name, filter_type):
+        return (subreddit_name.lower(), filter_type)
+
+    def get(self, subreddit_name, filter_type):
+        """Return a copy of the listing, fetching it at most once per TTL"""
+        key = self._key(subreddit_name, filter_type)
+        posts = self._listings.get(key)
+        if posts is not None:
+            self.hits += 1
+            return list(posts)
+
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self._in_flight[key] = flight
+                self.misses += 1
+
+        if not leader:
+            logger.info(f"Joining in-flight fetch of r/{subreddit_name} ({filter_type})")
+            return list(flight.result())
+
+        try:
+            posts = self._fetch(subreddit_name, filter_type)
+            self.put(subreddit_name, filter_type, posts)
+            flight.set_result(posts)
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return list(posts)
+
+    def put(self, subreddit_name, filter_type, posts):
+        self._listings.set(
+            self._key(subreddit_name, filter_type),
+            list(posts),
+            ttl=self._ttls.get(filter_type)
+        )
+
+    def is_cached(self, subreddit_name, filter_type):
+        return self._listings.get(self._key(subreddit_name, filter_type)) is not None
+
+    def invalidate(self, subreddit_name, filter_type):
+        self._listings.pop(self._key(subreddit_name, filter_type))
+
+    def stats(self):
+        return {
+            'listings': len(self._listings),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+LISTING_TTLS = {
+    'top_day': Config.LISTING_CACHE_TTL_TOP_DAY,
+    'top_week': Config.LISTING_CACHE_TTL_TOP_WEEK,
+    'top_month': Config.LISTING_CACHE_TTL_TOP_MONTH,
+    'top_year': Config.LISTING_CACHE_TTL_TOP_YEAR
+}
@@ -0,0 +1,162 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import Config
+from metrics import log_records_dropped_total, log_records_suppressed_total
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Chatty at INFO (a line per HTTP request or job run); only their warnings are kept
+LIBRARY_LOGGERS = ['azure', 'httpx', 'httpcore', 'urllib3', 'prawcore', 'telegram', 'apscheduler', 'werkzeug']
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any `extra=` fields included"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most `per_minute` DEBUG/INFO records per call site each minute.
+
+    Hot-path lines (one per post checked, per download, per request) keep a
+    sample instead of flooding the log; the first record let through after
+    a suppressed stretch says how many were dropped. Warnings and errors
+    always pass.
+    """
+
+    def __init__(self, per_minute, max_level=logging.INFO):
+        super().__init__()
+        self.per_minute = per_minute
+        self.max_level = max_level
+        self._windows = {}  # (pathname, lineno) -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.per_minute <= 0 or record.levelno > self.max_level:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= 60:
+                suppressed = window[2] if window else 0
+                window = self._windows[key] = [now, 0, 0]
+            else:
+                suppressed = 0
+            if window[1] >= self.per_minute:
+                window[2] += 1
+                log_records_suppressed_total.inc()
+                return False
+            window[1] += 1
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking or erroring"""
+
+    def prepare(self, record):
+        # Merge the message on the calling thread, but unlike QueueHandler keep
+        # exc_info so the listener's formatter (e.g. JSON's 'exception') renders it
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped_total.inc()
+
+class DrainingQueueListener(QueueListener):
+    """QueueListener whose stop() waits for room for its sentinel instead of raising queue.Full"""
+
+    def enqueue_sentinel(self):
+        # The writer thread keeps draining, so every queued record is written first
+        self.queue.put(self._sentinel, timeout=10)
+
+    def stop(self):
+        try:
+            self.enqueue_sentinel()
+        except queue.Full:
+            # A stuck handler keeps the queue full; joining would block exit for good
+            print("Log queue still full after 10s, not waiting for the log writer", file=sys.stderr)
+            self._thread = None
+            return
+        self._thread.join()
+        self._thread = None
+
+_listener = None
+
+def setup_logging():
+    """Send all logging through a bounded queue to a background writer thread.
+
+    Request, scheduler and pipeline threads only format and enqueue records;
+    the rotating file (and optional console) writes happen on the
+    listener's thread. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO)
+    if Config.LOG_FORMAT.lower() == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    handlers = [RotatingFileHandler(Config.LOG_FILE, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUP_COUNT)]
+    if Config.LOG_CONSOLE:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=Config.LOG_QUEUE_SIZE))
+    queue_handler.addFilter(RateLimitFilter(Config.LOG_RATE_LIMIT_PER_MINUTE))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    library_level = getattr(logging, Config.LOG_LIBRARY_LEVEL.upper(), logging.WARNING)
+    for name in LIBRARY_LOGGERS:
+        logging.getLogger(name).setLevel(max(level, library_level))
+
+    _listener = DrainingQueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
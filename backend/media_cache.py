@@ -0,0 +1,264 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Resumable partial downloads untouched this long are abandoned
+STALE_PART_SECONDS = 24 * 3600
+
+class MediaCache:
+    """Content-addressed on-disk cache for downloaded media.
+
+    Files live in <root>/objects/<sha256 of content><ext>. A URL points at
+    its content through a small file in <root>/urls/<sha256 of url>, so the
+    same URL is never downloaded twice while its content is cached, and
+    identical content from different URLs is stored once. Writes go to a
+    temp file first and are renamed into place. Entries are evicted least
+    recently used first once the cache exceeds its byte budget, and after
+    ttl_seconds without use when a TTL is set. Files handed out with
+    pin=True are never removed until release(path), so an upload can't lose
+    its file to another worker's put. Resumable downloads keep their partial
+    files in <root>/parts, which survives restarts, unlike <root>/tmp.
+    """
+
+    def __init__(self, root, max_bytes, ttl_seconds=0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.objects_dir = os.path.join(root, 'objects')
+        self.urls_dir = os.path.join(root, 'urls')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.parts_dir = os.path.join(root, 'parts')
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()  # object filename -> [size, last_used], LRU first
+        self._urls = {}  # url key -> object filename
+        self._pins = {}  # object filename -> number of holders
+        self._total_bytes = 0
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _url_key(url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def _load(self):
+        """Rebuild the in-memory index from disk on first use"""
+        if self._loaded:
+            return
+        for path in (self.objects_dir, self.urls_dir, self.tmp_dir, self.parts_dir):
+            os.makedirs(path, exist_ok=True)
+
+        # Leftovers from interrupted writes
+        for name in os.listdir(self.tmp_dir):
+            try:
+                os.remove(os.path.join(self.tmp_dir, name))
+            except OSError:
+                pass
+        # Partial downloads are kept for resuming, unless long abandoned
+        now = time.time()
+        for name in os.listdir(self.parts_dir):
+            path = os.path.join(self.parts_dir, name)
+            try:
+                if now - os.path.getmtime(path) > STALE_PART_SECONDS:
+                    os.remove(path)
+            except OSError:
+                pass
+
+        objects = []
+        for name in os.listdir(self.objects_dir):
+            stat = os.stat(os.path.join(self.objects_dir, name))
+            objects.append((stat.st_mtime, name, stat.st_size))
+        for last_used, name, size in sorted(objects):
+            self._entries[name] = [size, last_used]
+            self._total_bytes += size
+
+        for key in os.listdir(self.urls_dir):
+            pointer = os.path.join(self.urls_dir, key)
+            try:
+                with open(pointer) as f:
+                    name = f.read().strip()
+            except OSError:
+                continue
+            if name in self._entries:
+                self._urls[key] = name
+            else:
+                os.remove(pointer)
+
+        self._loaded = True
+        logger.info(f"Loaded media cache with {len(self._entries)} files ({self._total_bytes} bytes)")
+        self._evict()
+
+    def get(self, url, pin=False):
+        """Return the cached file path for a URL, or None"""
+        with self._lock:
+            self._load()
+            name = self._urls.get(self._url_key(url))
+            entry = self._entries.get(name) if name else None
+            if entry and self._expired(name, time.time()):
+                self._remove(name)
+                self.expirations += 1
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
+
+            path = os.path.join(self.objects_dir, name)
+            entry[1] = time.time()
+            self._entries.move_to_end(name)
+            try:
+                os.utime(path)
+            except OSError:
+                self._remove(name)
+                self.misses += 1
+                return None
+            self.hits += 1
+            if pin:
+                self._pin(name)
+            return path
+
+    def put_stream(self, url, chunks, ext, pin=False):
+        """Write an iterable of byte chunks into the cache and return the final path"""
+        with self._lock:
+            self._load()
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if chunk:
+                        digest.update(chunk)
+                        f.write(chunk)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return self.put_file(url, tmp_path, ext, digest.hexdigest(), pin=pin)
+
+    def put_file(self, url, tmp_path, ext, content_hash=None, pin=False):
+        """Move a finished temp file into the cache and return the final path"""
+        if content_hash is None:
+            content_hash = self.hash_file(tmp_path)
+        name = f"{content_hash}{ext}"
+        path = os.path.join(self.objects_dir, name)
+
+        with self._lock:
+            self._load()
+            if name in self._entries:
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+                size = os.path.getsize(path)
+                self._entries[name] = [size, time.time()]
+                self._total_bytes += size
+            self._entries[name][1] = time.time()
+            self._entries.move_to_end(name)
+
+            key = self._url_key(url)
+            fd, pointer_tmp = tempfile.mkstemp(dir=self.tmp_dir)
+            with os.fdopen(fd, 'w') as f:
+                f.write(name)
+            os.replace(pointer_tmp, os.path.join(self.urls_dir, key))
+            self._urls[key] = name
+
+            if pin:
+                self._pin(name)
+            self._evict(keep=name)
+        return path
+
+    def _pin(self, name):
+        self._pins[name] = self._pins.get(name, 0) + 1
+
+    def pin(self, path):
+        """Pin an already cached path; False if it is no longer in the cache"""
+        name = os.path.basename(path)
+        with self._lock:
+            if name not in self._entries:
+                return False
+            self._pin(name)
+            return True
+
+    def release(self, path):
+        """Unpin a path returned with pin=True, making it evictable again"""
+        name = os.path.basename(path)
+        with self._lock:
+            count = self._pins.get(name, 0) - 1
+            if count > 0:
+                self._pins[name] = count
+            else:
+                self._pins.pop(name, None)
+
+    @staticmethod
+    def hash_file(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def content_hash(path):
+        """Content hash of a cached file, taken from its name"""
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def _remove(self, name):
+        size, _ = self._entries.pop(name)
+        self._total_bytes -= size
+        for key in [k for k, v in self._urls.items() if v == name]:
+            del self._urls[key]
+            try:
+                os.remove(os.path.join(self.urls_dir, key))
+            except OSError:
+                pass
+        try:
+            os.remove(os.path.join(self.objects_dir, name))
+        except OSError:
+            pass
+
+    def _expired(self, name, now):
+        return self.ttl_seconds and name not in self._pins and now - self._entries[name][1] > self.ttl_seconds
+
+    def _evict(self, keep=None):
+        now = time.time()
+        for name in list(self._entries):
+            if name == keep or name in self._pins:
+                # In use; the budget may be exceeded until it is released
+                continue
+            over_budget = self._total_bytes > self.max_bytes
+            expired = self._expired(name, now)
+            if not over_budget and not expired:
+                # Entries are in LRU order, so nothing later is older
+                break
+            logger.info(f"{'Expiring' if expired else 'Evicting'} {name} from media cache")
+            self._remove(name)
+            if expired:
+                self.expirations += 1
+            else:
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'pinned': len(self._pins)
+            }
+
+# Create a singleton instance
+media_cache = MediaCache(
+    Config.MEDIA_CACHE_DIR,
+    Config.MEDIA_CACHE_MAX_BYTES,
+    Config.MEDIA_CACHE_TTL_SECONDS
+)
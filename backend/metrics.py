@@ -0,0 +1,246 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers cached lookups up to multi-minute video uploads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{self._labels(key)} {_format_value(value)}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram, as Prometheus expects it"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # [count per bucket..., sum]
+                series = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block, including when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self, key, series):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, series):
+            cumulative += count
+            labels = self._labels(key, [('le', _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(series[-1])}")
+        lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+class Registry:
+    """Metrics rendered together in the Prometheus text format.
+
+    Collectors run right before rendering, to refresh gauges that are
+    read from live state (queue sizes, scheduled jobs) instead of updated
+    as things happen.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {str(e)}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# Create a singleton registry and the app's metrics
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    'snoogram_stage_duration_seconds', 'Time spent in each send pipeline stage per tick',
+    ['stage', 'subreddit', 'media_type']
+)
+tick_seconds = registry.histogram(
+    'snoogram_tick_duration_seconds', 'Time from a tick being queued to it finishing',
+    ['subreddit', 'media_type']
+)
+tick_lateness_seconds = registry.histogram(
+    'snoogram_tick_lateness_seconds', 'Delay between a scheduled tick being due and starting to run'
+)
+ticks_total = registry.counter(
+    'snoogram_ticks_total', 'Finished ticks by outcome (sent, empty or error)',
+    ['subreddit', 'media_type', 'outcome']
+)
+late_ticks_total = registry.counter(
+    'snoogram_late_ticks_total', 'Scheduled ticks that started later than the late-warning threshold',
+    ['subreddit']
+)
+reddit_fetch_seconds = registry.histogram(
+    'snoogram_reddit_fetch_duration_seconds', 'Reddit listing request time', ['subreddit']
+)
+reddit_fetch_errors_total = registry.counter(
+    'snoogram_reddit_fetch_errors_total', 'Failed Reddit listing requests', ['subreddit']
+)
+skipped_posts_total = registry.counter(
+    'snoogram_skipped_posts_total', 'Candidate posts dropped as already sent or as reposts',
+    ['subreddit', 'reason']
+)
+download_seconds = registry.histogram(
+    'snoogram_download_duration_seconds', 'Time to download, relay or read from the cache one media item, by source',
+    ['subreddit', 'media_type', 'source']
+)
+download_bytes_total = registry.counter(
+    'snoogram_download_bytes_total', 'Bytes of media downloaded, relayed or read from the cache, by source',
+    ['subreddit', 'media_type', 'source']
+)
+download_failures_total = registry.counter(
+    'snoogram_download_failures_total', 'Media items that could not be downloaded', ['subreddit', 'media_type']
+)
+telegram_upload_seconds = registry.histogram(
+    'snoogram_telegram_upload_duration_seconds', 'Telegram send time per attempt', ['subreddit', 'media_type']
+)
+telegram_uploads_total = registry.counter(
+    'snoogram_telegram_uploads_total', 'Telegram send attempts by outcome (ok, flood, error or unknown after a timeout)',
+    ['subreddit', 'media_type', 'outcome']
+)
+db_write_seconds = registry.histogram(
+    'snoogram_db_write_duration_seconds', 'Storage write time per operation', ['operation']
+)
+cosmos_request_units_total = registry.counter(
+    'snoogram_cosmos_request_units_total', 'Cosmos DB request units consumed per operation', ['operation']
+)
+cosmos_throttled_requests_total = registry.counter(
+    'snoogram_cosmos_throttled_requests_total', 'Cosmos DB requests answered with 429 per operation', ['operation']
+)
+scheduler_jobs = registry.gauge('snoogram_scheduler_jobs', 'Scheduled subreddit jobs')
+scheduler_late_jobs = registry.gauge(
+    'snoogram_scheduler_late_jobs', 'Scheduled jobs whose run time has passed but that have not run yet'
+)
+scheduler_misfires_total = registry.counter(
+    'snoogram_scheduler_misfires_total', 'Scheduled runs skipped for starting past the misfire grace time',
+    ['subreddit']
+)
+pipeline_queued_ticks = registry.gauge('snoogram_pipeline_queued_ticks', 'Ticks waiting per pipeline stage', ['stage'])
+pipeline_in_flight = registry.gauge('snoogram_pipeline_in_flight_ticks', 'Ticks anywhere in the pipeline')
+log_records_dropped_total = registry.counter(
+    'snoogram_log_records_dropped_total', 'Log records dropped because the log queue was full'
+)
+log_records_suppressed_total = registry.counter(
+    'snoogram_log_records_suppressed_total', 'DEBUG/INFO log records held back by the per-call-site rate limit'
+)
+
+def media_type(items):
+    """'image', 'video', 'album' or 'none' for the media items of a send"""
+    if not items:
+        return 'none'
+    if len(items) > 1:
+        return 'album'
+    return 'video' if items[0].is_video else 'image'
+
+def observe_tick(tick, late_after=None):
+    """Record a finished pipeline tick: its stage timings, duration and outcome"""
+    labels = {'subreddit': tick.subreddit_name, 'media_type': media_type(tick.batch)}
+    for stage, seconds in tick.timings:
+        stage_seconds.observe(seconds, stage=stage, **labels)
+    if tick.finished_at is not None:
+        tick_seconds.observe(tick.finished_at - tick.enqueued_at, **labels)
+    outcome = 'error' if tick.error is not None else 'sent' if tick.sent else 'empty'
+    ticks_total.inc(outcome=outcome, **labels)
+    if not tick.inline and tick.lateness is not None:
+        tick_lateness_seconds.observe(tick.lateness)
+        if late_after is not None and tick.lateness > late_after:
+            late_ticks_total.inc(subreddit=tick.subreddit_name)
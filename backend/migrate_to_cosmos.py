@@ -1,5 +1,6 @@
 from cosmos_db import cosmos_db
 import logging
+import sys
 from datetime import datetime
 
 logging.basicConfig(level=logging.INFO)
@@ -83,5 +84,18 @@ def add_test_sent_post():
     except Exception as e:
         logger.error(f"Error adding test sent post: {str(e)}")
 
+def migrate_sent_posts_policy():
+    """Apply the retention TTL and indexing policy to an existing sent_posts container"""
+    result = cosmos_db.apply_sent_posts_policy()
+    if result is None:
+        logger.error("Failed to update sent_posts container")
+    elif result:
+        logger.info("sent_posts container updated")
+    else:
+        logger.info("sent_posts container was already up to date")
+
 if __name__ == "__main__":
-    verify_cosmos_db()
+    if len(sys.argv) > 1 and sys.argv[1] == 'sent-posts-policy':
+        migrate_sent_posts_policy()
+    else:
+        verify_cosmos_db()
@@ -0,0 +1,166 @@
+import logging
+import threading
+from config import Config
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+def dhash(source, size=8):
+    """64-bit difference hash of an image path or file object, or None if it can't be read.
+
+    Survives re-encoding, resizing and small edits, so the same picture
+    re-uploaded elsewhere hashes within a few bits of the original.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(source) as image:
+            pixels = list(image.convert('L').resize((size + 1, size), Image.LANCZOS).getdata())
+    except Exception as e:
+        logger.warning(f"Could not compute perceptual hash: {str(e)}")
+        return None
+
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+
+    # Flat or plain-gradient images hash to (nearly) all zeros or ones and would match each other
+    set_bits = bin(value).count('1')
+    if set_bits <= 2 or set_bits >= size * size - 2:
+        return None
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+def format_phash(phash):
+    return f"{phash:016x}" if phash is not None else None
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance.
+
+    A radius search only descends into children whose edge distance lies
+    within radius of the query's distance to the node, so most of the tree
+    is skipped for small radii.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, value, {distance: child}]
+        self.size = 0
+
+    def add(self, key, value):
+        node = [key, value, {}]
+        self.size += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming(key, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, key, radius):
+        """(distance, value) pairs within radius of key, nearest first"""
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node_key, value, children = stack.pop()
+            distance = hamming(key, node_key)
+            if distance <= radius:
+                matches.append((distance, value))
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return sorted(matches, key=lambda match: match[0])
+
+class PerceptualHashIndex:
+    """Perceptual hashes of sent media, for spotting reposts and cross-posts"""
+
+    def __init__(self, max_distance=None, enabled=None):
+        self.max_distance = Config.PHASH_MAX_DISTANCE if max_distance is None else max_distance
+        self.enabled = (Config.PHASH_DEDUP_ENABLED if enabled is None else enabled) and Image is not None
+        self._tree = BKTree()
+        self._pending = {}  # post_id -> phash reserved by a tick that has not finished sending
+        self._lock = threading.Lock()
+        if Image is None:
+            logger.warning("Pillow is not installed, perceptual media dedup disabled")
+
+    def warm(self, entries):
+        """Load (post_id, phash hex) pairs of previously sent posts"""
+        if not self.enabled:
+            return
+        if entries is None:
+            logger.warning("Sent post hashes unavailable, perceptual dedup index left cold")
+            return
+        tree = BKTree()
+        for post_id, phash in entries:
+            try:
+                tree.add(int(phash, 16), post_id)
+            except (TypeError, ValueError):
+                continue
+        with self._lock:
+            self._tree = tree
+        logger.info(f"Warmed perceptual dedup index with {tree.size} hashes")
+
+    def add(self, phash, post_id):
+        if not self.enabled or phash is None:
+            return
+        with self._lock:
+            self._tree.add(phash, post_id)
+
+    def find(self, phash):
+        """Post id of the closest sent media within max_distance, or None"""
+        if not self.enabled or phash is None:
+            return None
+        with self._lock:
+            matches = self._tree.search(phash, self.max_distance)
+        return matches[0][1] if matches else None
+
+    def reserve(self, phash, post_id):
+        """Check phash against sent and in-flight media, and claim it for post_id if new.
+
+        Returns (post id of the match, whether that post was already sent),
+        or (None, False) once phash is reserved. Checking and claiming under
+        one lock keeps two ticks holding cross-posts of one picture from both
+        getting through; release() drops the claim when the tick finishes.
+        """
+        if not self.enabled or phash is None:
+            return None, False
+        with self._lock:
+            matches = self._tree.search(phash, self.max_distance)
+            if matches:
+                return matches[0][1], True
+            for other_id, other in self._pending.items():
+                if other_id != post_id and hamming(phash, other) <= self.max_distance:
+                    return other_id, False
+            self._pending[post_id] = phash
+        return None, False
+
+    def release(self, post_id):
+        """Drop a reservation; a sent post is in the index by then through add()"""
+        with self._lock:
+            self._pending.pop(post_id, None)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'hashes': self._tree.size,
+            'reserved': len(self._pending),
+            'max_distance': self.max_distance
+        }
+
+# Create a singleton instance
+media_hash_index = PerceptualHashIndex()
@@ -0,0 +1,252 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class MediaItem:
+    """One prepared media file of a tick, waiting to be sent"""
+
+    def __init__(self, post, is_video, local_path=None, media_file=None, media_filename=None,
+                 media_hash=None, phash=None, caption=None):
+        self.post = post
+        self.is_video = is_video
+        self.local_path = local_path
+        self.media_file = media_file
+        self.media_filename = media_filename
+        self.media_hash = media_hash
+        self.phash = phash
+        self.caption = caption
+
+    @property
+    def source(self):
+        return self.media_file or self.local_path
+
+    def close(self):
+        if self.media_file is not None:
+            self.media_file.close()
+        self.media_file = None
+
+class Tick:
+    """One run of a subreddit config moving through the send pipeline"""
+
+    def __init__(self, config, due_at=None):
+        self.config = config
+        self.enqueued_at = time.time()
+        self.due_at = due_at if due_at is not None else self.enqueued_at
+        self.inline = False  # run on the caller's thread (send-now, first send) rather than scheduled
+        self.started_at = None
+        self.finished_at = None
+        self.posts = []
+        self.candidates = []
+        self.post = None
+        self.gallery = False
+        self.pending_media = []  # (url, is_video) still to download for the current post
+        self.batch = []  # MediaItems ready to send in this tick
+        self.is_video = False
+        self.media_url = None
+        self.local_path = None
+        self.media_hash = None
+        self.media_file = None
+        self.media_filename = None
+        self.phash = None
+        self.pinned_paths = []  # media cache files held until the tick finishes
+        self.hash_reservations = []  # post ids whose phash this tick reserved in the repost index
+        self.sent = False
+        self.error = None
+        self.timings = []  # (stage, seconds) of every handler run, in order
+
+    @property
+    def key(self):
+        return str(self.config['id'])
+
+    @property
+    def subreddit_name(self):
+        return self.config['subreddit_name']
+
+    def close_current_media(self):
+        """Release the buffer of the media item being prepared"""
+        if self.media_file is not None:
+            self.media_file.close()
+        self.media_file = None
+        self.media_filename = None
+
+    def close_media(self):
+        """Release every in-memory/spooled media buffer held by the tick"""
+        self.close_current_media()
+        for item in self.batch:
+            item.close()
+
+    @property
+    def lateness(self):
+        """Seconds between when the tick was due and when it started running"""
+        if self.started_at is None:
+            return None
+        return max(self.started_at - self.due_at, 0.0)
+
+class Stage:
+    def __init__(self, name, handler, concurrency, queue_size):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(int(concurrency), 1)
+        self.queue = queue.Queue()
+        # Forward hand-offs take a slot, which bounds the queue; retries sent
+        # back to an earlier stage skip it so stages can never deadlock
+        self.slots = threading.Semaphore(max(int(queue_size), 1))
+
+class Pipeline:
+    """Staged worker pipeline with per-stage concurrency and bounded queues.
+
+    Each stage handler takes a Tick and returns the name of the next stage,
+    or None once the tick is finished. Handlers may route a tick back to an
+    earlier stage (e.g. to try the next candidate after a failed download).
+    """
+
+    def __init__(self, stages, queue_size, late_warning_seconds=60, on_finish=None):
+        self._order = [name for name, _, _ in stages]
+        self._stages = {
+            name: Stage(name, handler, concurrency, queue_size)
+            for name, handler, concurrency in stages
+        }
+        self._late_warning_seconds = late_warning_seconds
+        self._finish_listeners = [on_finish] if on_finish else []
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+        self._lateness = deque(maxlen=1000)
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        for stage in self._stages.values():
+            for i in range(stage.concurrency):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(stage,),
+                    name=f"pipeline-{stage.name}-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Started pipeline with stages: {', '.join(self._order)}")
+
+    def add_finish_listener(self, listener):
+        """Call listener(tick) for every finished tick, e.g. to collect stage timings"""
+        self._finish_listeners.append(listener)
+
+    def _claim(self, tick):
+        """Mark the tick's config as in flight; False if another tick for it already is"""
+        with self._in_flight_lock:
+            if tick.key in self._in_flight:
+                logger.warning(f"Tick for r/{tick.subreddit_name} still in flight, skipping")
+                return False
+            self._in_flight.add(tick.key)
+            return True
+
+    def submit(self, tick):
+        """Queue a tick without blocking; False if the config is already in flight or the queue is full"""
+        if not self._claim(tick):
+            return False
+
+        first = self._stages[self._order[0]]
+        if not first.slots.acquire(blocking=False):
+            with self._in_flight_lock:
+                self._in_flight.discard(tick.key)
+            logger.warning(f"Pipeline queue full, dropping tick for r/{tick.subreddit_name}")
+            return False
+        first.queue.put((tick, True))
+        return True
+
+    def run_inline(self, tick):
+        """Run every stage for a tick on the calling thread, raising on failure.
+
+        Returns False without running if the config is already in flight, so
+        a send-now never races a scheduled tick into sending the same post.
+        """
+        if not self._claim(tick):
+            return False
+        tick.inline = True
+        tick.started_at = time.time()
+        stage_name = self._order[0]
+        try:
+            while stage_name:
+                stage_name = self._run_stage(self._stages[stage_name], tick)
+        except Exception as e:
+            tick.error = e
+            raise
+        finally:
+            self._finish(tick)
+        return True
+
+    def _worker(self, stage):
+        while True:
+            tick, holds_slot = stage.queue.get()
+            if holds_slot:
+                stage.slots.release()
+            if tick.started_at is None:
+                tick.started_at = time.time()
+
+            try:
+                next_stage = self._run_stage(stage, tick)
+            except Exception as e:
+                logger.error(f"Stage {stage.name} failed for r/{tick.subreddit_name}: {str(e)}")
+                tick.error = e
+                next_stage = None
+
+            if next_stage:
+                self._hand_off(stage.name, next_stage, tick)
+            else:
+                self._finish(tick)
+
+    def _run_stage(self, stage, tick):
+        started = time.perf_counter()
+        try:
+            return stage.handler(tick)
+        finally:
+            tick.timings.append((stage.name, time.perf_counter() - started))
+
+    def _hand_off(self, from_stage, to_stage, tick):
+        target = self._stages[to_stage]
+        forward = self._order.index(to_stage) > self._order.index(from_stage)
+        if forward:
+            target.slots.acquire()
+        target.queue.put((tick, forward))
+
+    def _finish(self, tick):
+        tick.finished_at = time.time()
+        tick.close_media()
+        with self._in_flight_lock:
+            self._in_flight.discard(tick.key)
+
+        # Inline runs (send-now, first send) are not scheduled, so they are never late
+        if not tick.inline and tick.lateness is not None:
+            self._lateness.append(tick.lateness)
+            message = (
+                f"Tick for r/{tick.subreddit_name} started {tick.lateness:.1f}s late "
+                f"and took {tick.finished_at - tick.started_at:.1f}s"
+            )
+            if tick.lateness > self._late_warning_seconds:
+                logger.warning(message)
+            else:
+                logger.info(message)
+
+        for listener in self._finish_listeners:
+            try:
+                listener(tick)
+            except Exception as e:
+                logger.error(f"Error in pipeline finish callback: {str(e)}")
+
+    def stats(self):
+        lateness = sorted(self._lateness)
+        return {
+            'in_flight': len(self._in_flight),
+            'queues': {name: self._stages[name].queue.qsize() for name in self._order},
+            'lateness': {
+                'count': len(lateness),
+                'avg': sum(lateness) / len(lateness) if lateness else 0.0,
+                'p95': lateness[int(len(lateness) * 0.95)] if lateness else 0.0,
+                'max': lateness[-1] if lateness else 0.0
+            }
+        }
@@ -0,0 +1,84 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class ByteBudget:
+    """Caps the number of bytes being downloaded at once.
+
+    Downloads of unknown length reserve unknown_size, so chunked responses
+    without a Content-Length still count against the cap.
+    """
+
+    def __init__(self, max_bytes, unknown_size):
+        self.max_bytes = max_bytes
+        self.unknown_size = unknown_size
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_reserve(self, size):
+        """Reserve size bytes (unknown_size if None or 0); returns the bytes reserved, 0 if they don't fit"""
+        size = size or self.unknown_size
+        with self._lock:
+            # A single file larger than the budget may still go when nothing else is in flight
+            if self.in_flight and self.in_flight + size > self.max_bytes:
+                return 0
+            self.in_flight += size
+            return size
+
+    def release(self, size):
+        with self._lock:
+            self.in_flight = max(self.in_flight - size, 0)
+
+class MediaPrefetcher:
+    """Warms the media cache for ticks that are about to fire.
+
+    `upcoming(lead_seconds)` yields (job_id, run_time, config) for jobs due
+    within the lead time; `prefetch(config, budget)` downloads the media of
+    the config's next candidate. Each job run is prefetched at most once,
+    with bounded concurrency and bytes in flight.
+    """
+
+    def __init__(self, upcoming, prefetch, lead_seconds, concurrency, max_bytes_in_flight, unknown_size):
+        self._upcoming = upcoming
+        self._prefetch = prefetch
+        self.lead_seconds = lead_seconds
+        self.budget = ByteBudget(max_bytes_in_flight, unknown_size)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='prefetch')
+        self._scheduled = {}  # job_id -> run_time already prefetched for
+        self._running = set()
+        self._lock = threading.Lock()
+        self.prefetched = 0
+
+    def scan(self):
+        """Queue prefetches for every job due within the lead time"""
+        for job_id, run_time, config in self._upcoming(self.lead_seconds):
+            with self._lock:
+                if self._scheduled.get(job_id) == run_time or job_id in self._running:
+                    continue
+                self._scheduled[job_id] = run_time
+                self._running.add(job_id)
+            self._executor.submit(self._run, job_id, config)
+
+    def _run(self, job_id, config):
+        try:
+            if self._prefetch(config, self.budget):
+                self.prefetched += 1
+        except Exception as e:
+            logger.error(f"Error prefetching media for r/{config['subreddit_name']}: {str(e)}")
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def forget(self, job_id):
+        """Drop what is known about a job, when it is rescheduled or removed"""
+        with self._lock:
+            self._scheduled.pop(job_id, None)
+
+    def stats(self):
+        return {
+            'prefetched': self.prefetched,
+            'running': len(self._running),
+            'bytes_in_flight': self.budget.in_flight
+        }
@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every caller of one service.
+
+    acquire() reserves tokens immediately and sleeps off any deficit outside
+    the lock, so waiting callers are served in arrival order. pause() stops
+    the bucket for a while, e.g. when the service asks us to back off.
+    Without max_wait, acquire() blocks the calling thread for as long as
+    that takes. A rate of 0 disables limiting, though pause() still applies.
+    """
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited = 0.0
+
+    def _reserve(self, tokens, max_wait=None):
+        now = time.monotonic()
+        # A pause applies even when the rate itself is unlimited
+        wait = max(self._paused_until - now, 0.0)
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self.rate)
+        if max_wait is not None and wait > max_wait:
+            if self.rate > 0:
+                self._tokens += tokens
+            return None
+        return wait
+
+    def acquire(self, tokens=1, max_wait=None):
+        """Block until `tokens` may be spent; returns the seconds waited.
+
+        With max_wait, returns None without waiting or spending anything
+        when the wait would be longer.
+        """
+        with self._lock:
+            wait = self._reserve(tokens, max_wait)
+            if wait is None:
+                return None
+            self.acquired += tokens
+            self.waited += wait
+        if wait > 0:
+            if wait > 1:
+                logger.debug(f"Rate limit {self.name}: waiting {wait:.1f}s")
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.warning(f"Rate limit {self.name}: paused for {seconds:.1f}s")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'burst': self.capacity,
+                'acquired': self.acquired,
+                'waited_seconds': round(self.waited, 3),
+                'paused_for': max(self._paused_until - time.monotonic(), 0.0)
+            }
+
+class KeyedTokenBuckets:
+    """One TokenBucket per key (e.g. per Telegram chat), created on first use"""
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        key = str(key)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(f"{self.name}:{key}", self.rate, self.burst)
+                self._buckets[key] = bucket
+            return bucket
+
+    def stats(self):
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {key: bucket.stats() for key, bucket in buckets.items()}
+
+# Create singleton instances shared by all scheduler jobs and pipeline workers
+reddit_limiter = TokenBucket('reddit', Config.REDDIT_RATE_PER_SECOND, Config.REDDIT_RATE_BURST)
+redgifs_limiter = TokenBucket('redgifs', Config.REDGIFS_RATE_PER_SECOND, Config.REDGIFS_RATE_BURST)
+cosmos_limiter = TokenBucket('cosmos', Config.COSMOS_RATE_PER_SECOND, Config.COSMOS_RATE_BURST)
+telegram_limiters = KeyedTokenBuckets('telegram', Config.TELEGRAM_CHAT_RATE_PER_SECOND, Config.TELEGRAM_CHAT_RATE_BURST)
+
+def rate_limit_stats():
+    return {
+        'reddit': reddit_limiter.stats(),
+        'redgifs': redgifs_limiter.stats(),
+        'cosmos': cosmos_limiter.stats(),
+        'telegram': telegram_limiters.stats()
+    }
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from config import Config
+from http_client import http_client
+from rate_limit import redgifs_limiter
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+REDGIFS_API_URL = Config.REDGIFS_API_URL
+
+class RedgifsClient:
+    """Redgifs API access shared by all scheduler threads.
+
+    Only one thread fetches a new temporary token at a time (single flight);
+    the others wait for it, or keep using the current token while it is
+    being refreshed early. Resolved video URLs are cached per gif id.
+    """
+
+    def __init__(self, token_ttl, refresh_margin, url_cache_ttl):
+        self.token_ttl = token_ttl
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._expires_at = 0
+        self._refresh_lock = threading.Lock()
+        self._video_urls = TTLCache(url_cache_ttl, maxsize=4096)
+
+    def _refresh_token(self):
+        try:
+            redgifs_limiter.acquire()
+            response = http_client.get(f'{REDGIFS_API_URL}/auth/temporary')
+            if response.status_code == 200:
+                self._token = response.json().get('token')
+                self._expires_at = time.time() + self.token_ttl
+                logger.info("Refreshed Redgifs token")
+            else:
+                logger.error(f"Failed to get Redgifs token: {response.status_code}")
+        except Exception as e:
+            logger.error(f"Error getting Redgifs token: {str(e)}")
+
+    def get_token(self):
+        """Get a valid access token for the Redgifs API"""
+        now = time.time()
+        if self._token and now < self._expires_at - self.refresh_margin:
+            return self._token
+
+        if self._token and now < self._expires_at:
+            # Still valid: refresh early if nobody else is, otherwise use the current one
+            if self._refresh_lock.acquire(blocking=False):
+                try:
+                    self._refresh_token()
+                finally:
+                    self._refresh_lock.release()
+            return self._token
+
+        with self._refresh_lock:
+            # Another thread may have refreshed while we waited
+            if not self._token or time.time() >= self._expires_at:
+                self._refresh_token()
+            if self._token and time.time() < self._expires_at:
+                return self._token
+        return None
+
+    def invalidate_token(self):
+        self._expires_at = 0
+
+    def get_video_url(self, video_id):
+        """Resolve a gif id to its hd (or sd) video URL"""
+        cached = self._video_urls.get(video_id)
+        if cached:
+            return cached
+
+        token = self.get_token()
+        if not token:
+            logger.error("Failed to get Redgifs token")
+            return None
+
+        redgifs_limiter.acquire()
+        response = http_client.get(
+            f'{REDGIFS_API_URL}/gifs/{video_id}',
+            headers={'Authorization': f'Bearer {token}'}
+        )
+        if response.status_code == 401:
+            self.invalidate_token()
+        if response.status_code == 429:
+            # Still throttled after the client's own retries: hold off every caller
+            redgifs_limiter.pause(Config.HTTP_BACKOFF_MAX)
+        if response.status_code != 200:
+            logger.error(f"Failed to get Redgifs video URL: {response.status_code}")
+            return None
+
+        urls = response.json().get('gif', {}).get('urls', {})
+        video_url = urls.get('hd') or urls.get('sd')
+        if video_url:
+            self._video_urls.set(video_id, video_url)
+        return video_url
+
+# Create a singleton instance
+redgifs = RedgifsClient(
+    token_ttl=Config.REDGIFS_TOKEN_TTL_SECONDS,
+    refresh_margin=Config.REDGIFS_TOKEN_REFRESH_MARGIN_SECONDS,
+    url_cache_ttl=Config.REDGIFS_URL_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,387 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime
+from config import Config
+from storage import ConcurrentModificationError, sent_posts_ttl_seconds
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS subreddit_configs (
+        id TEXT PRIMARY KEY,
+        subreddit_name TEXT NOT NULL,
+        data TEXT NOT NULL,
+        etag TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_subreddit_configs_subreddit_name ON subreddit_configs (subreddit_name)",
+    """CREATE TABLE IF NOT EXISTS sent_posts (
+        id TEXT PRIMARY KEY,
+        post_id TEXT NOT NULL,
+        subreddit_name TEXT NOT NULL,
+        sent_at TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        phash TEXT,
+        duplicate_of TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_sent_posts_post_id ON sent_posts (post_id)",
+    "CREATE INDEX IF NOT EXISTS idx_sent_posts_subreddit_sent_at ON sent_posts (subreddit_name, sent_at)",
+    "CREATE INDEX IF NOT EXISTS idx_sent_posts_ts ON sent_posts (ts)",
+    """CREATE TABLE IF NOT EXISTS telegram_files (
+        media_hash TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        media_type TEXT,
+        created_at TEXT NOT NULL
+    )"""
+]
+
+SENT_POST_COLUMNS = "id, post_id, subreddit_name, sent_at, duplicate_of, ts"
+
+# How often inserts also delete sent posts past the retention window
+PURGE_INTERVAL_SECONDS = 3600
+
+class SQLiteDB:
+    """Local SQLite storage with the same interface as CosmosDB.
+
+    For single-node deployments (and offline benchmarks): lookups are
+    in-process index hits instead of network round trips. Each thread gets
+    its own connection; the database runs in WAL mode so readers never
+    wait for the writer. All statements are constant and parameterized, so
+    sqlite3's statement cache keeps them prepared. Configs are stored as
+    JSON with an etag column for the same optimistic concurrency as Cosmos.
+
+    SQLITE_PATH=:memory: uses a throwaway temp file removed at exit. A
+    shared-cache in-memory database locks whole tables across connections
+    ("database table is locked"), which busy_timeout does not retry.
+
+    Retention is enforced at startup and then at most once per
+    PURGE_INTERVAL_SECONDS by whichever insert comes due.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Config.SQLITE_PATH
+        self._file = self.path
+        self._local = threading.local()
+        self._next_purge = 0.0
+        self._purge_lock = threading.Lock()
+        if self.path == ':memory:':
+            fd, self._file = tempfile.mkstemp(prefix='snoogram-', suffix='.db')
+            os.close(fd)
+            atexit.register(self._remove_temp_file)
+        self._initialize()
+
+    def _remove_temp_file(self):
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(self._file + suffix)
+            except OSError:
+                pass
+
+    def _connect(self):
+        conn = sqlite3.connect(self._file, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _initialize(self):
+        self.is_initialized = False
+        try:
+            if self.path != ':memory:':
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+            conn = self._conn
+            with conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+            self.is_initialized = True
+            logger.info(f"SQLite storage initialized at {self.path}")
+            self._purge_expired()
+        except Exception as e:
+            logger.error(f"Error initializing SQLite storage: {str(e)}")
+            logger.error(traceback.format_exc())
+
+    def _purge_expired(self):
+        """Delete sent posts past the retention window (the Cosmos backend uses a container TTL)"""
+        self._next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+        ttl = sent_posts_ttl_seconds()
+        if ttl is None:
+            return
+        with self._conn as conn:
+            deleted = conn.execute("DELETE FROM sent_posts WHERE ts < ?", (int(time.time()) - ttl,)).rowcount
+        if deleted:
+            logger.info(f"Purged {deleted} expired sent posts")
+
+    def _purge_if_due(self):
+        if time.monotonic() < self._next_purge or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() >= self._next_purge:
+                self._purge_expired()
+        except Exception as e:
+            logger.error(f"Error purging expired sent posts: {str(e)}")
+        finally:
+            self._purge_lock.release()
+
+    @staticmethod
+    def _config_row(row):
+        config = json.loads(row['data'])
+        config['_etag'] = row['etag']
+        return config
+
+    @staticmethod
+    def _sent_post_row(row):
+        post = dict(row)
+        post['_ts'] = post.pop('ts')
+        return post
+
+    def _write_config(self, conn, config_data, etag):
+        data = {k: v for k, v in config_data.items() if k != '_etag'}
+        conn.execute(
+            "INSERT OR REPLACE INTO subreddit_configs (id, subreddit_name, data, etag) VALUES (?, ?, ?, ?)",
+            (data['id'], data['subreddit_name'], json.dumps(data), etag)
+        )
+        return dict(data, _etag=etag)
+
+    def create_subreddit_config(self, config_data):
+        """Create a new subreddit configuration"""
+        try:
+            config_data['id'] = str(uuid.uuid4())
+            config_data['created_at'] = datetime.utcnow().isoformat()
+            config_data['last_check'] = datetime.utcnow().isoformat()
+            config_data['is_active'] = True
+            with self._conn as conn:
+                result = self._write_config(conn, config_data, str(uuid.uuid4()))
+            logger.info(f"Successfully created config in SQLite: {result}")
+            return result
+        except Exception as e:
+            logger.error(f"Error creating subreddit config in SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    def get_subreddit_config(self, subreddit_name):
+        """Get subreddit configuration by name"""
+        try:
+            row = self._conn.execute(
+                "SELECT data, etag FROM subreddit_configs WHERE subreddit_name = ? LIMIT 1",
+                (subreddit_name,)
+            ).fetchone()
+            return self._config_row(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting subreddit config from SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    def get_all_subreddit_configs(self):
+        """Get all subreddit configurations"""
+        try:
+            rows = self._conn.execute("SELECT data, etag FROM subreddit_configs").fetchall()
+            return [self._config_row(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting all subreddit configs from SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return []
+
+    def get_subreddit_config_by_id(self, config_id):
+        """Get subreddit configuration by id"""
+        try:
+            row = self._conn.execute(
+                "SELECT data, etag FROM subreddit_configs WHERE id = ?",
+                (str(config_id),)
+            ).fetchone()
+            return self._config_row(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting subreddit config {config_id} from SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    def replace_subreddit_config(self, config_data):
+        """Replace a subreddit configuration read earlier, only if it has not changed since.
+
+        Raises ConcurrentModificationError when the stored etag no longer matches.
+        """
+        config_data['id'] = str(config_data['id'])
+        try:
+            data = {k: v for k, v in config_data.items() if k != '_etag'}
+            etag = str(uuid.uuid4())
+            with self._conn as conn:
+                updated = conn.execute(
+                    "UPDATE subreddit_configs SET subreddit_name = ?, data = ?, etag = ? WHERE id = ? AND etag = ?",
+                    (data['subreddit_name'], json.dumps(data), etag, data['id'], config_data.get('_etag'))
+                ).rowcount
+            if updated:
+                return dict(data, _etag=etag)
+        except Exception as e:
+            logger.error(f"Error replacing subreddit config in SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+        logger.warning(f"Subreddit config {config_data['id']} was modified concurrently")
+        raise ConcurrentModificationError(config_data['id'])
+
+    def update_subreddit_config(self, config_data):
+        """Update an existing subreddit configuration"""
+        try:
+            config_data['id'] = str(config_data['id'])
+            with self._conn as conn:
+                return self._write_config(conn, config_data, str(uuid.uuid4()))
+        except Exception as e:
+            logger.error(f"Error updating subreddit config in SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    def delete_subreddit_config(self, config_id, subreddit_name):
+        """Delete a subreddit configuration"""
+        try:
+            with self._conn as conn:
+                conn.execute(
+                    "DELETE FROM subreddit_configs WHERE id = ? AND subreddit_name = ?",
+                    (str(config_id), subreddit_name)
+                )
+        except Exception as e:
+            logger.error(f"Error deleting subreddit config from SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+
+    def create_sent_post(self, post_data):
+        """Record a sent post"""
+        try:
+            post_data['id'] = str(uuid.uuid4())
+            post_data['sent_at'] = datetime.utcnow().isoformat()
+            ts = int(time.time())
+            with self._conn as conn:
+                conn.execute(
+                    "INSERT INTO sent_posts (id, post_id, subreddit_name, sent_at, ts, phash, duplicate_of) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (post_data['id'], post_data['post_id'], post_data['subreddit_name'], post_data['sent_at'],
+                     ts, post_data.get('phash'), post_data.get('duplicate_of'))
+                )
+            self._purge_if_due()
+            return dict(post_data, _ts=ts)
+        except Exception as e:
+            logger.error(f"Error creating sent post in SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    def is_duplicate_post(self, post_id):
+        """Check if a post has been sent before"""
+        try:
+            row = self._conn.execute("SELECT 1 FROM sent_posts WHERE post_id = ? LIMIT 1", (post_id,)).fetchone()
+            return row is not None
+        except Exception as e:
+            logger.error(f"Error checking duplicate post in SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return False
+
+    def find_sent_post_ids(self, post_ids, subreddit_name):
+        """Return the subset of post_ids already sent for a subreddit"""
+        post_ids = list(post_ids)
+        if not post_ids:
+            return set()
+
+        try:
+            # The id list is passed as one JSON parameter so the statement text never changes
+            rows = self._conn.execute(
+                "SELECT post_id FROM sent_posts WHERE subreddit_name = ? "
+                "AND post_id IN (SELECT value FROM json_each(?))",
+                (subreddit_name, json.dumps(post_ids))
+            ).fetchall()
+            return {row['post_id'] for row in rows}
+        except Exception as e:
+            logger.error(f"Error finding sent posts in SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return set()
+
+    def get_all_sent_post_ids(self):
+        """Get the post ids of every sent post, or None if they could not be loaded"""
+        try:
+            rows = self._conn.execute("SELECT post_id FROM sent_posts").fetchall()
+            logger.info(f"Found {len(rows)} sent posts in SQLite")
+            return [row['post_id'] for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting sent post ids from SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    def get_sent_posts_page(self, limit, since_ts=None, before_ts=None, exclude_ids=None, subreddit_name=None):
+        """Get up to `limit` sent posts, newest first (see CosmosDB.get_sent_posts_page)"""
+        try:
+            rows = self._conn.execute(
+                f"SELECT {SENT_POST_COLUMNS} FROM sent_posts "
+                "WHERE (?1 IS NULL OR ts >= ?1) AND (?2 IS NULL OR ts <= ?2) "
+                "AND (?3 IS NULL OR subreddit_name = ?3) "
+                "AND id NOT IN (SELECT value FROM json_each(?4)) "
+                "ORDER BY ts DESC, sent_at DESC LIMIT ?5",
+                (since_ts, before_ts, subreddit_name, json.dumps(list(exclude_ids or [])), int(limit))
+            ).fetchall()
+            return [self._sent_post_row(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting sent posts page from SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    def get_sent_post_phashes(self):
+        """Get (post_id, phash) of every sent post with a perceptual hash, or None on error"""
+        try:
+            rows = self._conn.execute("SELECT post_id, phash FROM sent_posts WHERE phash IS NOT NULL").fetchall()
+            return [(row['post_id'], row['phash']) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting sent post hashes from SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    def apply_sent_posts_policy(self):
+        """Apply the retention window now; there is no index policy to migrate"""
+        try:
+            self._purge_expired()
+            return False
+        except Exception as e:
+            logger.error(f"Error purging expired sent posts: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    def get_telegram_file_id(self, media_hash):
+        """Get the Telegram file_id recorded for a media content hash"""
+        try:
+            row = self._conn.execute(
+                "SELECT file_id FROM telegram_files WHERE media_hash = ?",
+                (media_hash,)
+            ).fetchone()
+            return row['file_id'] if row else None
+        except Exception as e:
+            logger.error(f"Error getting Telegram file_id from SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    def save_telegram_file_id(self, media_hash, file_id, media_type):
+        """Record the Telegram file_id for a media content hash"""
+        try:
+            created_at = datetime.utcnow().isoformat()
+            with self._conn as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO telegram_files (media_hash, file_id, media_type, created_at) VALUES (?, ?, ?, ?)",
+                    (media_hash, file_id, media_type, created_at)
+                )
+            return {'id': media_hash, 'file_id': file_id, 'media_type': media_type, 'created_at': created_at}
+        except Exception as e:
+            logger.error(f"Error saving Telegram file_id in SQLite: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+# Create a singleton instance
+sqlite_db = SQLiteDB()
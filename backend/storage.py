@@ -0,0 +1,35 @@
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# A sent post must outlive the longest listing window (top_year) or it could be picked again
+SENT_POSTS_MIN_TTL_DAYS = 366
+
+class ConcurrentModificationError(Exception):
+    """Raised when an item changed between being read and being replaced"""
+
+def sent_posts_ttl_seconds():
+    """Retention for sent posts in seconds, or None to keep them forever"""
+    days = Config.SENT_POSTS_TTL_DAYS
+    if days <= 0:
+        return None
+    if days < SENT_POSTS_MIN_TTL_DAYS:
+        logger.warning(f"SENT_POSTS_TTL_DAYS={days} is shorter than the top_year window, using {SENT_POSTS_MIN_TTL_DAYS}")
+        days = SENT_POSTS_MIN_TTL_DAYS
+    return days * 24 * 60 * 60
+
+def get_storage():
+    """The storage backend selected by Config.STORAGE_BACKEND ('cosmos' or 'sqlite').
+
+    Both expose the same methods; only the selected one is imported, so
+    a SQLite deployment never touches the Cosmos client.
+    """
+    backend = Config.STORAGE_BACKEND.lower()
+    if backend == 'sqlite':
+        from sqlite_db import sqlite_db
+        return sqlite_db
+    if backend != 'cosmos':
+        logger.warning(f"Unknown STORAGE_BACKEND '{Config.STORAGE_BACKEND}', using cosmos")
+    from cosmos_db import cosmos_db
+    return cosmos_db
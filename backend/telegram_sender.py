@@ -0,0 +1,78 @@
+import atexit
+import concurrent.futures
+import logging
+import threading
+from background_loop import BackgroundLoop
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class SendOutcomeUnknown(Exception):
+    """A send timed out and was cancelled; Telegram may or may not have received it"""
+
+class TelegramSender:
+    """Runs Telegram calls on one long-lived event loop.
+
+    The Application (and its Bot HTTP client) is initialized once and kept
+    open for the life of the process, so connections are reused between
+    sends instead of being set up and torn down for every message.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self._loop = BackgroundLoop('telegram-sender')
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the sender loop and initialize the Application (idempotent)"""
+        with self._lock:
+            if self._loop.is_running:
+                return
+
+            self._loop.start()
+            try:
+                self._loop.submit(self.application.initialize()).result()
+            except Exception:
+                self._loop.stop()
+                raise
+
+            atexit.register(self.stop)
+            logger.info("Telegram sender started")
+
+    def submit(self, coro):
+        """Schedule a coroutine on the sender loop from any thread.
+
+        Returns a concurrent.futures.Future for the coroutine's result.
+        """
+        try:
+            self.start()
+        except Exception:
+            coro.close()
+            raise
+        return self._loop.submit(coro)
+
+    def run(self, coro, timeout=None):
+        """Submit a coroutine and block until it finishes.
+
+        On timeout the task is cancelled on the loop, so it can't complete
+        later behind the caller's back, and SendOutcomeUnknown is raised.
+        """
+        timeout = timeout or Config.TELEGRAM_SEND_TIMEOUT
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # Cancelling the concurrent future cancels the task on the loop
+            future.cancel()
+            raise SendOutcomeUnknown(f"No response from Telegram within {timeout}s")
+
+    def stop(self):
+        with self._lock:
+            if not self._loop.is_running:
+                return
+            try:
+                self._loop.submit(self.application.shutdown()).result(timeout=10)
+            except Exception as e:
+                logger.error(f"Error shutting down Telegram application: {str(e)}")
+            self._loop.stop()
+        logger.info("Telegram sender stopped")
@@ -0,0 +1,41 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Small thread-safe mapping whose entries expire after ttl seconds.
+
+    Holds at most maxsize entries, dropping the oldest first.
+    """
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._items = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if time.monotonic() >= expires_at:
+                del self._items[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._items.pop(key, None)
+            return default if item is None else item[1]
+
+    def __len__(self):
+        return len(self._items)
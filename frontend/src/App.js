@@ -7,11 +7,13 @@ function App() {
   const [searchResults, setSearchResults] = useState([]);
   const [filterType, setFilterType] = useState('top_day');
   const [frequency, setFrequency] = useState(60);
+  const [batchSize, setBatchSize] = useState(1);
   const [showDropdown, setShowDropdown] = useState(false);
   const [editingConfig, setEditingConfig] = useState(null);
   const [editForm, setEditForm] = useState({
     filter_type: '',
-    frequency: ''
+    frequency: '',
+    batch_size: ''
   });
   const [isAdding, setIsAdding] = useState(false);
   const [sendingNow, setSendingNow] = useState(null);
@@ -75,7 +77,8 @@ function App() {
     const config = {
       subreddit_name: searchTerm.replace(/^r\//, ''),
       filter_type: filterType,
-      frequency: parseInt(frequency)
+      frequency: parseInt(frequency),
+      batch_size: parseInt(batchSize)
     };
 
     try {
@@ -93,6 +96,7 @@ function App() {
       setSearchTerm('');
       setFilterType('top_day');
       setFrequency(60);
+      setBatchSize(1);
       fetchConfigs();
     } catch (error) {
       console.error('Error adding configuration:', error);
@@ -158,7 +162,8 @@ function App() {
     setEditingConfig(config.id);
     setEditForm({
       filter_type: config.filter_type,
-      frequency: config.frequency
+      frequency: config.frequency,
+      batch_size: config.batch_size || 1
     });
   };
 
@@ -166,7 +171,8 @@ function App() {
     setEditingConfig(null);
     setEditForm({
       filter_type: '',
-      frequency: ''
+      frequency: '',
+      batch_size: ''
     });
   };
 
@@ -187,7 +193,8 @@ function App() {
       setEditingConfig(null);
       setEditForm({
         filter_type: '',
-        frequency: ''
+        frequency: '',
+        batch_size: ''
       });
       fetchConfigs();
     } catch (error) {
@@ -264,6 +271,18 @@ function App() {
           />
         </div>
 
+        <div className="form-group">
+          <label>Posts per send (1-10):</label>
+          <input
+            type="number"
+            value={batchSize}
+            onChange={(e) => setBatchSize(e.target.value)}
+            min="1"
+            max="10"
+            disabled={isAdding}
+          />
+        </div>
+
         <button type="submit" disabled={!searchTerm.trim() || isAdding}>
           {isAdding ? (
             <span className="spinner"></span>
@@ -297,6 +316,13 @@ function App() {
                       onChange={(e) => setEditForm({...editForm, frequency: parseInt(e.target.value)})}
                       min="1"
                     />
+                    <input
+                      type="number"
+                      value={editForm.batch_size}
+                      onChange={(e) => setEditForm({...editForm, batch_size: parseInt(e.target.value)})}
+                      min="1"
+                      max="10"
+                    />
                     <div className="edit-actions">
                       <button onClick={() => handleSaveEdit(config.id)}>Save</button>
                       <button onClick={handleCancelEdit}>Cancel</button>
@@ -306,6 +332,7 @@ function App() {
                   <>
                     <p>Filter: {config.filter_type}</p>
                     <p>Frequency: {config.frequency} minutes</p>
+                    <p>Posts per send: {config.batch_size || 1}</p>
                     <p>Status: {config.is_active ? 'Active' : 'Inactive'}</p>
                   </>
                 )}